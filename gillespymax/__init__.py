@@ -3,5 +3,8 @@
 __version__ = "0.0.0a1"
 
 from .sim import GillespieMaxSim
-from .events import BaseEvent, NoEvent
+from .events import BaseEvent, NoEvent, ParameterEvent
+from .groups import GroupCounts
+from .writer import RecordWriter
+from .streams import CounterStreams
 from .config_loader import load
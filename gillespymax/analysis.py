@@ -1,11 +1,13 @@
-import h5py
+import glob
+import os
 import polars as pl
-import seaborn as sns
 from os import PathLike
-from typing import Iterable
+from typing import Iterable, Mapping
 
 def read_records(filename: PathLike):
     """Returns a Mapping of simulation ids to parsed simulation dataframes"""
+    import h5py
+
     dataframes = dict()
     with h5py.File(filename, "r") as fp:
         for group in fp:
@@ -17,6 +19,55 @@ def read_records(filename: PathLike):
 
     return dataframes
 
+def scan_records(directory: PathLike, format='parquet', schema: Mapping | None = None):
+    """Lazily scans a dataset written by write_columnar into one frame, with a sim_id column
+
+    Local files are memory-mapped, and filters (e.g. on sim_id or the written attrs) are
+    pushed down to skip the partitions and row groups that do not match.
+    Partitions with different columns (e.g. attrs) are combined, with nulls where a column is missing.
+    An empty (or missing) dataset gives an empty frame.
+
+    For Parquet, the columns of the whole dataset are found by reading the footer of every file,
+    which can take longer than a filtered scan; pass schema (column name -> dtype) to skip this.
+    """
+    if format == 'parquet':
+        pattern = os.path.join(directory, 'sim_id=*', '*.parquet')
+    elif format == 'ipc':
+        pattern = os.path.join(directory, 'sim_id=*', '*.arrow')
+    else:
+        raise ValueError(f"Unknown columnar format: {format}")
+
+    paths = sorted(glob.glob(pattern))
+    if len(paths) == 0:
+        return pl.LazyFrame(schema={'sim_id': pl.String})
+
+    if format == 'parquet':
+        if schema is None:
+            # union of the columns of all partitions (from the file footers only)
+            schema = dict()
+            for path in paths:
+                schema.update(pl.read_parquet_schema(path))
+        schema = {name: dtype for name, dtype in schema.items() if name != 'sim_id'}
+        return pl.scan_parquet(
+            pattern,
+            hive_partitioning=True,
+            hive_schema={'sim_id': pl.String},
+            schema=schema,
+            missing_columns='insert',
+        )
+
+    # IPC scans cannot insert missing columns, so files with the same columns are scanned together
+    by_schema = dict()
+    for path in paths:
+        by_schema.setdefault(tuple(pl.read_ipc_schema(path).items()), []).append(path)
+    return pl.concat(
+        [
+            pl.scan_ipc(group, hive_partitioning=True, hive_schema={'sim_id': pl.String})
+            for group in by_schema.values()
+        ],
+        how='diagonal_relaxed',
+    )
+
 def _df_longer(dataframe: pl.DataFrame, states_to_plot: Iterable):
     return (
         dataframe
@@ -29,6 +80,8 @@ def _df_longer(dataframe: pl.DataFrame, states_to_plot: Iterable):
     )
 
 def _plot_hist(df_long: pl.DataFrame, ax=None, **kwargs):
+    import seaborn as sns
+
     return sns.lineplot(
         df_long,
         x='t',
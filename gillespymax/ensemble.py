@@ -0,0 +1,189 @@
+"""Ensembles of replicates that keep running until their summary statistics converge
+
+Rather than fixing the number of replicates in advance, replicates of each scenario are run
+until the confidence intervals of the summary statistics (e.g. final size, peak prevalence,
+peak time) are narrower than requested, or a maximum number of replicates is reached.
+Worker processes are given to the scenarios that are furthest from converging.
+"""
+
+import math
+import multiprocessing as mp
+import os
+import queue
+import random
+from statistics import NormalDist
+from typing import Any, Callable, Mapping
+
+from .sweep import replicate_seed
+
+
+class RunningStats(object):
+    """
+    Online mean and variance (Welford's algorithm)
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def __str__(self):
+        return f"RunningStats[n = {self.n}, mean = {self.mean}, sd = {self.sd}]"
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else float("Inf")
+
+    @property
+    def sd(self):
+        return math.sqrt(self.variance)
+
+    def half_width(self, confidence=0.95):
+        """Half-width of the (normal approximation) confidence interval of the mean"""
+        if self.n < 2:
+            return float("Inf")
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        return z * self.sd / math.sqrt(self.n)
+
+
+def epidemic_summary(sim, prevalence_states="EI", susceptible_state="S"):
+    """Final size, peak prevalence and peak time of a finished simulation
+
+    Args:
+        sim (Simulator): Finished simulation, recording the prevalence and susceptible states
+        prevalence_states (Iterable, optional): States that count towards prevalence. Defaults to "EI".
+        susceptible_state (str, optional): State that is depleted by infection. Defaults to "S".
+    """
+    records = sim.records
+    prevalence = [
+        sum(counts)
+        for counts in zip(*(records.states[state] for state in prevalence_states))
+    ]
+    peak = max(range(len(prevalence)), key=prevalence.__getitem__)
+    susceptible = records.states[susceptible_state]
+    return {
+        "final_size": susceptible[0] - susceptible[-1],
+        "peak_prevalence": prevalence[peak],
+        "peak_time": records.t[peak],
+    }
+
+
+def _run_replicate(setup, scenario, seed, until, summarise):
+    random.seed(seed)
+    sim = setup(scenario, seed)
+    sim.run(until=until)
+    return summarise(sim)
+
+
+def run_adaptive(
+    setup: Callable,
+    scenarios: Mapping[str, Any],
+    target_width: float | Mapping[str, float],
+    until=100,
+    confidence=0.95,
+    min_replicates=10,
+    max_replicates=1000,
+    seed=0,
+    summarise: Callable = epidemic_summary,
+    processes: int | None = None,
+):
+    """Runs replicates of each scenario until their summary statistics converge
+
+    Args:
+        setup (Callable): Function (scenario, seed) -> Simulator that builds a ready-to-run simulation. The random module is seeded before it is called. Must be picklable (e.g. a module-level function).
+        scenarios (Mapping): name -> scenario (e.g. a parameter set) passed to setup
+        target_width (float | Mapping): Confidence interval width to reach, for every statistic, or per statistic (statistic name -> width).
+        until (float, optional): Time to run each simulation until. Defaults to 100.
+        confidence (float, optional): Confidence level of the intervals. Defaults to 0.95.
+        min_replicates (int, optional): Replicates to run before checking convergence. Defaults to 10.
+        max_replicates (int, optional): Maximum replicates of a scenario. Defaults to 1000.
+        seed (int, optional): Base seed that replicate seeds are derived from. Defaults to 0.
+        summarise (Callable, optional): Function (finished Simulator) -> {statistic name: value}. Must be picklable. Defaults to epidemic_summary.
+        processes (int | None, optional): Number of worker processes. Defaults to the number of CPUs.
+
+    Returns:
+        dict: scenario name -> {"replicates": int, "converged": bool, "statistics": {statistic name: RunningStats}}
+    """
+    processes = os.cpu_count() if processes is None else processes
+
+    statistics = {name: dict() for name in scenarios}
+    issued = {name: 0 for name in scenarios}
+    in_flight = {name: 0 for name in scenarios}
+
+    def widths(name):
+        # ratio of each interval width to its target
+        stats = statistics[name]
+        if len(stats) == 0:
+            return [float("Inf")]
+        if isinstance(target_width, Mapping):
+            targets = target_width
+        else:
+            targets = {stat: target_width for stat in stats}
+        return [
+            2 * stats[stat].half_width(confidence) / target
+            for stat, target in targets.items()
+        ]
+
+    def completed(name):
+        return issued[name] - in_flight[name]
+
+    def converged(name):
+        return completed(name) >= min_replicates and max(widths(name)) <= 1
+
+    def priority(name):
+        # first bring every scenario up to the minimum, then the least converged
+        if issued[name] < min_replicates:
+            return (1, -issued[name])
+        return (0, max(widths(name)) / (1 + in_flight[name]))
+
+    done = queue.Queue()
+    with mp.Pool(processes) as pool:
+        while True:
+            while sum(in_flight.values()) < processes:
+                candidates = [
+                    name
+                    for name in scenarios
+                    if issued[name] < max_replicates and not converged(name)
+                ]
+                if len(candidates) == 0:
+                    break
+                name = max(candidates, key=priority)
+                pool.apply_async(
+                    _run_replicate,
+                    (
+                        setup,
+                        scenarios[name],
+                        replicate_seed(f"{seed}:{name}", issued[name]),
+                        until,
+                        summarise,
+                    ),
+                    callback=lambda summary, name=name: done.put((name, summary)),
+                    error_callback=lambda err, name=name: done.put((name, err)),
+                )
+                issued[name] += 1
+                in_flight[name] += 1
+
+            if sum(in_flight.values()) == 0:
+                break
+
+            name, summary = done.get()
+            in_flight[name] -= 1
+            if isinstance(summary, BaseException):
+                raise summary
+            for stat, value in summary.items():
+                statistics[name].setdefault(stat, RunningStats()).add(value)
+
+    return {
+        name: {
+            "replicates": completed(name),
+            "converged": converged(name),
+            "statistics": statistics[name],
+        }
+        for name in scenarios
+    }
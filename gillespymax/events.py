@@ -3,6 +3,7 @@
 Taken from [cobin](https://gitlab.com/cma-public-projects/cobin)
 """
 
+import heapq
 from enum import Enum
 
 
@@ -22,3 +23,48 @@ class NoEvent(BaseEvent, Enum):
     """A shadow event (no reaction) enum. Used as a sentinel object."""
 
     no_event = 0
+
+
+class ParameterEvent(BaseEvent, Enum):
+    """A scheduled change of the simulation parameters. Ordered before reactions at the same time."""
+
+    change = -1
+
+
+class EventQueue(object):
+    """
+    Priority queue of scheduled events (t, event_type, *info), earliest first, on a binary heap.
+    Supports the subset of the SortedList interface used by the simulators:
+    add, len, peeking at the earliest entry with [0], and removing it with pop(0).
+    """
+
+    __slots__ = ("heap",)
+
+    def __init__(self, entries=()):
+        self.heap = list(entries)
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __bool__(self):
+        return len(self.heap) > 0
+
+    def __iter__(self):
+        return iter(sorted(self.heap))
+
+    def __repr__(self):
+        return f"EventQueue({sorted(self.heap)!r})"
+
+    def add(self, entry):
+        heapq.heappush(self.heap, entry)
+
+    def __getitem__(self, index):
+        if index != 0:
+            raise IndexError("EventQueue only supports access to the earliest entry")
+        return self.heap[0]
+
+    def pop(self, index=0):
+        if index != 0:
+            raise IndexError("EventQueue only supports removal of the earliest entry")
+        return heapq.heappop(self.heap)
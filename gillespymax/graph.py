@@ -0,0 +1,439 @@
+"""Read-only compact graphs that can be shared between processes without copying
+
+CompactGraph stores the adjacency of a graph in compressed sparse row (CSR) form, with the
+nodes numbered 0..n-1, and integer or categorical (string) node attributes as arrays.
+It supports the subset of the networkx Graph interface used by the simulators (iteration,
+len, graph.nodes[node] attribute lookup, neighbors, graph[node]), so it can be passed to a
+simulator in place of an nx.Graph.
+
+The arrays can be placed in shared memory, or saved to a directory and memory-mapped, so that
+worker processes attach to one copy of the graph rather than each holding their own.
+A shared or memory-mapped graph pickles to a reference to its storage, so passing it to a
+worker process (e.g. through a Pool or PartitionedSim) does not copy the arrays.
+
+Lookups in the simulation loop go through per-process caches of Python objects (the decoded
+column of each attribute looked up, and the neighbour tuple of each node looked up), since
+indexing the arrays for every event costs more than the rest of the lookup.
+
+Usage:
+    graph = CompactGraph.from_networkx(nx_graph)
+    with graph.to_shared_memory() as shared:
+        with mp.Pool() as pool:
+            pool.map(run_replicate, [(shared, seed) for seed in seeds])
+"""
+
+import json
+import os
+import sys
+import weakref
+from collections.abc import Mapping
+from multiprocessing import shared_memory
+
+import numpy as np
+
+if os.name == "posix":
+    from multiprocessing import resource_tracker
+else:
+    resource_tracker = None
+
+# byte alignment of each array in a shared memory block
+_ALIGNMENT = 64
+
+# value of an attribute in a decoded column (see CompactGraph.column) for nodes without it
+_ABSENT = object()
+
+
+def _int_dtype(low, high):
+    """Smallest signed integer dtype that holds values in [low, high]"""
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    raise OverflowError(f"Values in [{low}, {high}] do not fit in 64 bit integers")
+
+
+class _SharedMemory(shared_memory.SharedMemory):
+    """
+    SharedMemory that only the creating process registers with the resource tracker.
+    Before Python 3.13, attaching to a block also registers it, so that the block is unlinked
+    when any process that attached to it exits. Closing is also deferred while arrays still view the block.
+    """
+
+    def __init__(self, name=None, create=False, size=0):
+        if create or resource_tracker is None:
+            super().__init__(name=name, create=create, size=size)
+        elif sys.version_info >= (3, 13):
+            super().__init__(name=name, size=size, track=False)
+        else:
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                super().__init__(name=name, size=size)
+            finally:
+                resource_tracker.register = register
+
+    def __del__(self):
+        try:
+            self.close()
+        except (OSError, BufferError):
+            # arrays still view the block, which is unmapped when they are freed
+            pass
+
+
+def _unlink(shm, pid):
+    # forked children inherit the graph, but only the creating process unlinks it
+    if os.getpid() == pid:
+        shm.unlink()
+
+
+class NodeAttributes(Mapping):
+    """
+    Read-only view of the attributes of a node of a CompactGraph (as graph.nodes[node]).
+    Attributes that are absent for the node raise KeyError, so .get gives a default.
+    """
+
+    __slots__ = ("graph", "node")
+
+    def __init__(self, graph, node):
+        self.graph = graph
+        self.node = node
+
+    def __getitem__(self, attr):
+        column = self.graph._columns.get(attr) or self.graph.column(attr)
+        value = column[self.node]
+        if value is _ABSENT:
+            raise KeyError(attr)
+        return value
+
+    def get(self, attr, default=None):
+        column = self.graph._columns.get(attr)
+        if column is None:
+            if attr not in self.graph.attributes:
+                return default
+            column = self.graph.column(attr)
+        value = column[self.node]
+        return default if value is _ABSENT else value
+
+    def __iter__(self):
+        return (
+            attr
+            for attr in self.graph.attributes
+            if self.graph.column(attr)[self.node] is not _ABSENT
+        )
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class NodeView(object):
+    """
+    The nodes of a CompactGraph (as graph.nodes). Iterates over the nodes, can be called
+    (as graph.nodes()), and is indexed by node to look up its attributes.
+    """
+
+    __slots__ = ("graph",)
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __iter__(self):
+        return iter(self.graph)
+
+    def __len__(self):
+        return len(self.graph)
+
+    def __contains__(self, node):
+        return node in self.graph
+
+    def __call__(self):
+        return self
+
+    def __getitem__(self, node):
+        return NodeAttributes(self.graph, node)
+
+
+class CompactGraph(object):
+    """
+    Undirected graph in CSR form: the neighbours of node i are indices[indptr[i]:indptr[i + 1]].
+    Node attributes are integer arrays (attributes), with a presence mask (masks) for attributes
+    that only some nodes have. Categorical attributes are stored as codes into a list of categories.
+    All arrays are read-only.
+    """
+
+    def __init__(
+        self,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        attributes: Mapping[str, np.ndarray] | None = None,
+        masks: Mapping[str, np.ndarray] | None = None,
+        categories: Mapping[str, list] | None = None,
+    ):
+        """
+        Args:
+            indptr (np.ndarray): Offset of the neighbours of each node in indices (length n + 1)
+            indices (np.ndarray): Neighbours of each node, concatenated
+            attributes (Mapping | None, optional): attribute name -> value (or category code) of each node. Defaults to None.
+            masks (Mapping | None, optional): attribute name -> whether each node has the attribute, for attributes that not all nodes have. Defaults to None.
+            categories (Mapping | None, optional): attribute name -> categories, for categorical attributes. Defaults to None.
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.attributes = dict() if attributes is None else dict(attributes)
+        self.masks = dict() if masks is None else dict(masks)
+        self.categories = (
+            dict()
+            if categories is None
+            else {attr: list(cats) for attr, cats in categories.items()}
+        )
+        for array in self.arrays().values():
+            array.flags.writeable = False
+
+        self.nodes = NodeView(self)
+        # per-process lookup caches (see column and neighbors), not carried to other processes
+        self._columns = dict()
+        self._neighbours = [None] * len(self)
+        # original node of each id, if built from another graph (not carried to other processes)
+        self.labels = None
+
+        # where the arrays live, if not in (private) memory
+        self.handle = None
+        self.directory = None
+        self.mmap_mode = None
+        self._shm = None
+        self._finalizer = None
+
+    def __repr__(self):
+        return f"CompactGraph[{len(self)} nodes, {self.number_of_edges()} edges]"
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __contains__(self, node):
+        return isinstance(node, (int, np.integer)) and 0 <= node < len(self)
+
+    def __getitem__(self, node):
+        return self.neighbors(node)
+
+    def number_of_nodes(self):
+        return len(self)
+
+    def number_of_edges(self):
+        return len(self.indices) // 2
+
+    def degree(self, node):
+        return int(self.indptr[node + 1] - self.indptr[node])
+
+    def neighbors(self, node):
+        """Tuple of the neighbours of a node
+
+        Built on the first lookup of the node and kept, so a process holds the neighbours
+        of the nodes it looks up as Python objects, besides the (shared) arrays.
+        """
+        neighbours = self._neighbours[node]
+        if neighbours is None:
+            neighbours = tuple(
+                self.indices[self.indptr[node] : self.indptr[node + 1]].tolist()
+            )
+            self._neighbours[node] = neighbours
+        return neighbours
+
+    def column(self, attr):
+        """Values of an attribute by node as a list, with categories decoded
+
+        Nodes without the attribute have the value _ABSENT. Built on the first lookup of
+        the attribute and kept.
+        """
+        column = self._columns.get(attr)
+        if column is None:
+            column = self.attributes[attr].tolist()
+            categories = self.categories.get(attr)
+            if categories is not None:
+                column = [categories[value] for value in column]
+            mask = self.masks.get(attr)
+            if mask is not None:
+                column = [
+                    value if present else _ABSENT
+                    for value, present in zip(column, mask.tolist())
+                ]
+            self._columns[attr] = column
+        return column
+
+    def arrays(self):
+        """All arrays of the graph, by (storage) name"""
+        return {
+            "indptr": self.indptr,
+            "indices": self.indices,
+            **{f"attr.{attr}": values for attr, values in self.attributes.items()},
+            **{f"mask.{attr}": mask for attr, mask in self.masks.items()},
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, np.ndarray], categories=None):
+        """Builds a graph from arrays named as in CompactGraph.arrays"""
+        attributes, masks = dict(), dict()
+        for name, array in arrays.items():
+            kind, _, attr = name.partition(".")
+            if kind == "attr":
+                attributes[attr] = array
+            elif kind == "mask":
+                masks[attr] = array
+        return cls(
+            arrays["indptr"],
+            arrays["indices"],
+            attributes=attributes,
+            masks=masks,
+            categories=categories,
+        )
+
+    @classmethod
+    def from_networkx(cls, graph, attributes=None):
+        """Builds a compact copy of a networkx graph
+
+        Nodes are numbered in the iteration order of the graph, so a graph whose nodes
+        are already 0..n-1 (in order) keeps its node ids. The original nodes are kept in labels.
+
+        Args:
+            graph (nx.Graph): Graph to copy
+            attributes (Iterable | None, optional): Node attributes to copy. Values must be integers (or bools) or strings (stored as categories). If None, copies all node attributes. Defaults to None.
+        """
+        nodes = list(graph)
+        n = len(nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(
+            np.fromiter((len(graph[node]) for node in nodes), dtype=np.int64, count=n)
+        )
+        indices = np.fromiter(
+            (index[nb] for node in nodes for nb in graph[node]),
+            dtype=np.int32 if n < 2**31 else np.int64,
+            count=indptr[-1],
+        )
+
+        node_data = [graph.nodes[node] for node in nodes]
+        if attributes is None:
+            attributes = dict.fromkeys(attr for data in node_data for attr in data)
+
+        values, masks, categories = dict(), dict(), dict()
+        for attr in attributes:
+            present = np.fromiter((attr in data for data in node_data), bool, count=n)
+            column = [data[attr] for data in node_data if attr in data]
+            if all(isinstance(value, str) for value in column):
+                cats = list(dict.fromkeys(column))
+                code = {cat: i for i, cat in enumerate(cats)}
+                column = [code[value] for value in column]
+                categories[attr] = cats
+            elif not all(isinstance(value, (int, np.integer)) for value in column):
+                raise TypeError(
+                    f"Node attribute {attr!r} must be integer or string valued to be stored in a CompactGraph"
+                )
+            column = np.array(column, dtype=np.int64)
+            dtype = (
+                _int_dtype(column.min(), column.max())
+                if len(column) > 0
+                else np.dtype(np.int8)
+            )
+            values[attr] = np.zeros(n, dtype=dtype)
+            values[attr][present] = column
+            if not present.all():
+                masks[attr] = present
+
+        compact = cls(
+            indptr, indices, attributes=values, masks=masks, categories=categories
+        )
+        compact.labels = nodes
+        return compact
+
+    def to_shared_memory(self):
+        """Copies the graph into a block of shared memory
+
+        The returned graph owns the block, and unlinks it when it is closed (or at exit).
+        It must outlive the processes attaching to it. Other processes attach to it
+        (without copying) by unpickling it, or with CompactGraph.attach(graph.handle).
+        """
+        arrays = self.arrays()
+        layout, size = [], 0
+        for name, array in arrays.items():
+            layout.append((name, array.dtype.str, array.shape, size))
+            size += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+
+        shm = _SharedMemory(create=True, size=max(size, 1))
+        for (_, dtype, shape, offset), array in zip(layout, arrays.values()):
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+
+        handle = {"name": shm.name, "layout": layout, "categories": self.categories}
+        shared = self.attach(handle)
+        shared.labels = self.labels
+        shared._finalizer = weakref.finalize(shared, _unlink, shm, os.getpid())
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        """Attaches to a graph in shared memory, without copying it
+
+        Args:
+            handle (dict): handle of the shared graph (see to_shared_memory)
+        """
+        shm = _SharedMemory(name=handle["name"])
+        arrays = {
+            name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            for name, dtype, shape, offset in handle["layout"]
+        }
+        graph = cls.from_arrays(arrays, categories=handle["categories"])
+        graph.handle = handle
+        graph._shm = shm
+        return graph
+
+    def close(self):
+        """Unlinks the shared memory of the graph, if this graph created it
+
+        Attached processes keep their mapping, but no more processes can attach.
+        """
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def save(self, directory: str | os.PathLike):
+        """Saves the graph to a directory (one .npy file per array), to be memory-mapped with load"""
+        os.makedirs(directory, exist_ok=True)
+        arrays = self.arrays()
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        with open(os.path.join(directory, "graph.json"), "w") as fp:
+            json.dump({"arrays": list(arrays), "categories": self.categories}, fp)
+
+    @classmethod
+    def load(cls, directory: str | os.PathLike, mmap_mode="r"):
+        """Loads a graph saved with save
+
+        Args:
+            directory (str): Directory the graph was saved to
+            mmap_mode (str | None, optional): Mode to memory-map the arrays with (see np.load). If None, reads them into memory. Defaults to 'r'.
+        """
+        with open(os.path.join(directory, "graph.json"), "r") as fp:
+            meta = json.load(fp)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in meta["arrays"]
+        }
+        graph = cls.from_arrays(arrays, categories=meta["categories"])
+        if mmap_mode is not None:
+            graph.directory = os.fspath(directory)
+            graph.mmap_mode = mmap_mode
+        return graph
+
+    def __reduce__(self):
+        # shared and memory-mapped graphs are passed by reference to their storage
+        if self.handle is not None:
+            return (self.attach, (self.handle,))
+        if self.directory is not None:
+            return (self.load, (self.directory, self.mmap_mode))
+        return (self.from_arrays, (self.arrays(), self.categories))
@@ -0,0 +1,168 @@
+"""Per-group bookkeeping of member states for group-structured (e.g. bipartite) networks
+
+Lets a simulator aggregate propensities over the members of a group node,
+rather than attempting events node-by-node and rejecting those that cannot occur.
+"""
+
+import random
+
+from .ratetree import FenwickTree
+
+
+class GroupCounts(object):
+    """
+    Tracks, for each group node, which of its members are in each of a set of tracked states.
+    Members are kept in indexable lists (with a position map) so that insertion, removal and
+    a uniform draw of a member are all O(1).
+    Each member may also carry a weight (that can depend on the group), and the sum of
+    the weights of the members in each state is kept per group. The cumulative weights of
+    the members are kept in a Fenwick tree, so that a weighted draw is O(log(members)).
+    """
+
+    def __init__(self, graph, status, groups, tracked_states, weight=None):
+        """Builds the group counts from the current status of the graph
+
+        Args:
+            graph (nx.Graph): Graph where group nodes are adjacent to their members
+            status (Mapping): Current state of each node
+            groups (Iterable): Group nodes to track
+            tracked_states (Iterable): States to keep counts and members of
+            weight (Callable | None, optional): Function (node, group) -> float that gives the weight of a member in a group. If None, all members have weight 1. Defaults to None.
+        """
+        self.graph = graph
+        self.tracked_states = set(tracked_states)
+        self.weight = weight
+
+        self.members = {
+            group: {state: [] for state in self.tracked_states} for group in groups
+        }
+        # group -> member -> (index in member list, weight)
+        self.position = {group: dict() for group in self.members}
+        self.totals = {
+            group: {state: 0.0 for state in self.tracked_states}
+            for group in self.members
+        }
+        self.sizes = {group: len(graph[group]) for group in self.members}
+        # weights of the members, in the order of the member lists
+        self.cumulative = (
+            None
+            if weight is None
+            else {
+                group: {state: FenwickTree() for state in self.tracked_states}
+                for group in self.members
+            }
+        )
+
+        for group in self.members:
+            for node in graph.neighbors(group):
+                if status[node] in self.tracked_states:
+                    self._add(group, node, status[node])
+
+    def __contains__(self, group):
+        return group in self.members
+
+    def _add(self, group, node, state):
+        w = 1.0 if self.weight is None else self.weight(node, group)
+        members = self.members[group][state]
+        self.position[group][node] = (len(members), w)
+        members.append(node)
+        self.totals[group][state] += w
+        if self.cumulative is not None:
+            self.cumulative[group][state].append(w)
+
+    def _remove(self, group, node, state):
+        idx, w = self.position[group].pop(node)
+        members = self.members[group][state]
+        # swap with the last member so that removal is O(1)
+        last = members.pop()
+        if self.cumulative is not None:
+            cumulative = self.cumulative[group][state]
+            last_w = cumulative.pop()
+            if last != node:
+                cumulative.set(idx, last_w)
+        if last != node:
+            members[idx] = last
+            self.position[group][last] = (idx, self.position[group][last][1])
+        if len(members) == 0:
+            # avoid accumulating floating point error in empty groups
+            self.totals[group][state] = 0.0
+        else:
+            self.totals[group][state] -= w
+
+    def reweight(self):
+        """Recomputes the weights of all members (e.g. after the weight function's parameters change)"""
+        for group, group_members in self.members.items():
+            position = self.position[group]
+            for state, members in group_members.items():
+                total = 0.0
+                for node in members:
+                    idx, _ = position[node]
+                    w = 1.0 if self.weight is None else self.weight(node, group)
+                    position[node] = (idx, w)
+                    total += w
+                self.totals[group][state] = total
+                if self.cumulative is not None:
+                    self.cumulative[group][state] = FenwickTree(
+                        position[node][1] for node in members
+                    )
+
+    def groups_of(self, node):
+        """Returns the tracked groups that a node is a member of"""
+        return [group for group in self.graph.neighbors(node) if group in self.members]
+
+    def update(self, node, from_state, to_state):
+        """Moves a node between states in all the groups it is a member of
+
+        Args:
+            node (Hashable): Node that has changed state
+            from_state (Hashable): State of the node before the change
+            to_state (Hashable): State of the node after the change
+
+        Returns:
+            list: groups whose counts have changed
+        """
+        if from_state == to_state:
+            return []
+        from_tracked = from_state in self.tracked_states
+        to_tracked = to_state in self.tracked_states
+        if not (from_tracked or to_tracked):
+            return []
+
+        groups = self.groups_of(node)
+        for group in groups:
+            if from_tracked:
+                self._remove(group, node, from_state)
+            if to_tracked:
+                self._add(group, node, to_state)
+        return groups
+
+    def count(self, group, state):
+        """Number of members of the group in the given state"""
+        return len(self.members[group][state])
+
+    def total(self, group, state):
+        """Sum of the weights of the members of the group in the given state"""
+        return self.totals[group][state]
+
+    def size(self, group):
+        """Number of members of the group (in any state)"""
+        return self.sizes[group]
+
+    def choose(self, group, state, weighted=False, u=None):
+        """Chooses a random member of the group in the given state
+
+        Args:
+            group (Hashable): Group to choose from
+            state (Hashable): State that the chosen member is in
+            weighted (bool, optional): If True, chooses proportional to the member weights, otherwise uniformly. Defaults to False.
+            u (float | None, optional): Uniform variate to make the choice with. If None, draws one. Defaults to None.
+        """
+        members = self.members[group][state]
+        if not weighted or self.weight is None:
+            if u is None:
+                return random.choice(members)
+            return members[int(u * len(members))]
+        cumulative = self.cumulative[group][state]
+        if u is None:
+            u = random.random()
+        return members[cumulative.find(u * cumulative.total())]
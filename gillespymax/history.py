@@ -1,9 +1,136 @@
+from __future__ import annotations
+
 from collections import Counter
-import h5py
 import datetime
+import os
 import secrets
-import polars as pl
 from os import PathLike
+from typing import TYPE_CHECKING
+
+# h5py and polars are slow to import, so are only imported when records are output
+if TYPE_CHECKING:
+    import polars as pl
+
+COLUMNAR_FORMATS = {"parquet": ".parquet", "ipc": ".arrow"}
+
+
+def transition_code(efrom="", astatus="", eto=""):
+    """String representation of the states of the nodes involved in an event"""
+    pre_state = ",".join(filter(None, [efrom, astatus]))
+    post_state = ",".join(filter(None, [eto, astatus]))
+    return f"({pre_state}) -> ({post_state})"
+
+
+# separates the values of a string column when it is packed into a single string
+_SEPARATOR = "\x1f"
+
+
+class _PackedStrings(str):
+    """Values of a string column, joined into one string"""
+
+
+def _pack_column(column):
+    if len(column) == 0:
+        return column
+    if isinstance(column[0], str):
+        packed = _SEPARATOR.join(column)
+        if packed.count(_SEPARATOR) == len(column) - 1:
+            return _PackedStrings(packed)
+        # some value contains the separator
+        return column
+    import numpy as np
+
+    return np.array(column)
+
+
+def _unpack_column(column):
+    if isinstance(column, _PackedStrings):
+        return str(column).split(_SEPARATOR)
+    if hasattr(column, "tolist"):
+        return column.tolist()
+    return column
+
+
+def _pack_state(records):
+    """State of a records object for pickling, with its columns packed
+
+    Numeric columns are packed as NumPy arrays and string columns as single strings, which
+    pickle (e.g. to a RecordWriter process) far faster than lists of Python objects.
+    """
+    state = dict()
+    for attr in records.__slots__:
+        value = records.__getattribute__(attr)
+        if isinstance(value, list):
+            value = _pack_column(value)
+        elif type(value) is dict and all(isinstance(v, list) for v in value.values()):
+            value = {k: _pack_column(v) for k, v in value.items()}
+        state[attr] = value
+    return state
+
+
+def _unpack_state(records, state):
+    """Restores the state packed by _pack_state, with its columns as lists again"""
+    for attr, value in state.items():
+        if type(value) is dict:
+            value = {k: _unpack_column(v) for k, v in value.items()}
+        else:
+            value = _unpack_column(value)
+        records.__setattr__(attr, value)
+
+
+def new_sim_id():
+    """Generates a (practically) unique id for a simulation"""
+    return f"{datetime.datetime.now().timestamp() * 1e6:.0f}_{secrets.token_hex(4)}"
+
+
+def write_columnar(
+    dataframe: pl.DataFrame, directory: PathLike, sim_id=None, format="parquet", **attrs
+):
+    """Output a record table as a partition of a hive-partitioned Parquet or Arrow IPC dataset
+
+    The table is written to `<directory>/sim_id=<sim_id>/part-<n>.<ext>`, so that records of many
+    simulations can be scanned together (see analysis.scan_records), with sim_id as a column.
+    Writing again to the same sim_id adds another part, e.g. for detached records.
+    String columns are dictionary-encoded (as categoricals), and attrs are added as constant columns.
+
+    Args:
+        dataframe (pl.DataFrame): Record table to write
+        directory (str): Path to the root directory of the dataset
+        sim_id (Hashable | None, optional): ID of the partition to write into. If None, generates a random id. Defaults to None
+        format (str): one of 'parquet' or 'ipc'. Defaults to 'parquet'.
+        **attrs: Metadata (e.g. parameters, replicate) to add as columns
+
+    Returns:
+        sim_id of the partition the records are written to
+    """
+    import polars as pl
+
+    if format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown columnar format: {format}")
+
+    if sim_id is None:
+        sim_id = new_sim_id()
+
+    dataframe = dataframe.with_columns(
+        pl.col(pl.String).cast(pl.Categorical),
+        *(
+            pl.lit(
+                value, dtype=pl.Categorical if isinstance(value, str) else None
+            ).alias(name)
+            for name, value in attrs.items()
+        ),
+    )
+
+    partition = os.path.join(directory, f"sim_id={sim_id}")
+    os.makedirs(partition, exist_ok=True)
+    n_parts = sum(name.startswith("part-") for name in os.listdir(partition))
+    path = os.path.join(partition, f"part-{n_parts:05d}{COLUMNAR_FORMATS[format]}")
+    if format == "parquet":
+        dataframe.write_parquet(path, statistics=True)
+    else:
+        dataframe.write_ipc(path)
+
+    return sim_id
 
 
 class ContagionRecords:
@@ -33,6 +160,7 @@ class ContagionRecords:
         "astatus",
         "txncode",
         "states",
+        "counts",
     )
 
     def __init__(self, return_statuses):
@@ -51,6 +179,13 @@ class ContagionRecords:
         self.txncode = []
         # need to init this way to get distinct lists
         self.states = {state: [] for state in return_statuses}
+        self.counts = {state: 0 for state in return_statuses}
+
+    def __getstate__(self):
+        return _pack_state(self)
+
+    def __setstate__(self, state):
+        _unpack_state(self, state)
 
     def set_initial_condition(self, t0, status):
         """Sets the initial record in the record table
@@ -62,7 +197,7 @@ class ContagionRecords:
         Constructs the first entry in each of the slots. By default, empty strings are used in
         place of Nones.
         """
-        self.t.append(t0)
+        self.t.append(float(t0))
         # append in empty strings for initial condition
         self.enode.append("")
         self.anode.append("")
@@ -74,6 +209,7 @@ class ContagionRecords:
         status_counter = Counter(status.values())
         for state, state_record in self.states.items():
             # Counters have a default value of 0
+            self.counts[state] = status_counter[state]
             state_record.append(status_counter[state])
 
     def add(self, t, enode="", anode="", group="", efrom="", eto="", astatus=""):
@@ -90,10 +226,7 @@ class ContagionRecords:
 
         Also generates a txncode that represents the event category
         """
-        # compute txn code
-        pre_state = ",".join(filter(None, [efrom, astatus]))
-        post_state = ",".join(filter(None, [eto, astatus]))
-        txncode = f"({pre_state}) -> ({post_state})"
+        txncode = transition_code(efrom, astatus, eto)
 
         self.t.append(float(t))
         self.enode.append(str(enode))
@@ -103,44 +236,112 @@ class ContagionRecords:
         self.eto.append(str(eto))
         self.astatus.append(str(astatus))
         self.txncode.append(txncode)  # already a str
-        for state_record in self.states.values():
-            state_record.append(state_record[-1])
-        self.states.get(efrom, [0])[-1] -= 1
-        self.states.get(eto, [0])[-1] += 1
+        if efrom in self.counts:
+            self.counts[efrom] -= 1
+        if eto in self.counts:
+            self.counts[eto] += 1
+        for state, state_record in self.states.items():
+            state_record.append(self.counts[state])
+
+    def finalise(self, t):
+        """Marks the end of the simulation at time t. Nothing to do for per-event records."""
+        pass
+
+    def detach(self):
+        """Moves the rows recorded so far into a new record table, leaving this one empty
+
+        The state counts carry on from the moved rows, so successive detached tables
+        can be written (in order) to the same sim_id to build up the full record table.
+        """
+        detached = ContagionRecords(return_statuses=self.states)
+        for attr in (
+            "t",
+            "enode",
+            "anode",
+            "group",
+            "efrom",
+            "eto",
+            "astatus",
+            "txncode",
+        ):
+            detached.__setattr__(attr, self.__getattribute__(attr))
+            self.__setattr__(attr, [])
+        detached.states = self.states
+        detached.counts = dict(self.counts)
+        self.states = {state: [] for state in self.states}
+        return detached
 
     def write(self, filename: PathLike, sim_id=None, mode="a", **attrs):
         """Output the record table to hdf5 format
 
         Args:
             filename (str): Path to file to output record table into
-            sim_id (Hashable | None, optional): ID to use as the group name in the file. If None, generates a random id. Defaults to None
+            sim_id (Hashable | None, optional): ID to use as the group name in the file. If None, generates a random id. If the group already exists, the records are appended to it. Defaults to None
             mode (str): one of 'a' or 'w'. If 'a', appends; if 'w', overwrites the target file.
             **attrs: Attributes to add to the group
         """
+        import h5py
 
         if sim_id is None:
-            sim_id = f"{datetime.datetime.now().timestamp() * 1e6:.0f}_{secrets.token_hex(4)}"
+            sim_id = new_sim_id()
+
+        columns = {
+            **{
+                attr: self.__getattribute__(attr)
+                for attr in (
+                    "t",
+                    "enode",
+                    "anode",
+                    "group",
+                    "efrom",
+                    "eto",
+                    "astatus",
+                    "txncode",
+                )
+            },
+            **self.states,
+        }
+        # explicit types, so that an empty table can be extended later
+        dtypes = {
+            name: ("f8" if name == "t" else h5py.string_dtype())
+            for name in columns
+            if name not in self.states
+        }
 
         with h5py.File(filename, mode) as fp:
-            grp = fp.create_group(sim_id)
-            grp.attrs.update(attrs)
-            for attr in (
-                "t",
-                "enode",
-                "anode",
-                "group",
-                "efrom",
-                "eto",
-                "astatus",
-                "txncode",
-            ):
-                grp.create_dataset(attr, data=self.__getattribute__(attr))
-            for state, record in self.states.items():
-                grp.create_dataset(state, data=record)
+            if sim_id in fp:
+                # continuation of a record table (see detach)
+                grp = fp[sim_id]
+                grp.attrs.update(attrs)
+                for name, data in columns.items():
+                    dataset = grp[name]
+                    n = dataset.shape[0]
+                    dataset.resize((n + len(data),))
+                    dataset[n:] = data
+            else:
+                grp = fp.create_group(sim_id)
+                grp.attrs.update(attrs)
+                for name, data in columns.items():
+                    grp.create_dataset(
+                        name,
+                        data=data,
+                        dtype=dtypes.get(name, "i8"),
+                        maxshape=(None,),
+                        chunks=True,
+                    )
 
         return sim_id
 
+    def write_columnar(
+        self, directory: PathLike, sim_id=None, format="parquet", **attrs
+    ):
+        """Output the record table (as in to_dataframe) to a Parquet or Arrow IPC dataset (see write_columnar)"""
+        return write_columnar(
+            self.to_dataframe(), directory, sim_id=sim_id, format=format, **attrs
+        )
+
     def to_dataframe(self):
+        import polars as pl
 
         return pl.from_dict(
             {
@@ -159,4 +360,199 @@ class ContagionRecords:
                 },
                 **self.states,
             }
-        )
\ No newline at end of file
+        )
+
+
+class GridRecords:
+    """Counts of states sampled on a fixed time grid.
+
+    The state counts are snapshotted as the simulation passes each time in the grid,
+    so the size of the records depends on the number of grid points, not on the number of events.
+
+    Attributes:
+        t : grid times that have been passed
+        states : count of each recorded state at each grid time
+        transitions : count of each type of transition (by txncode) in the interval ending at each grid time, if counted
+    """
+
+    __slots__ = (
+        "t",
+        "grid",
+        "states",
+        "counts",
+        "count_transitions",
+        "transitions",
+        "interval_transitions",
+        "next_index",
+    )
+
+    def __init__(self, return_statuses, times, count_transitions=False):
+        """Initalise an empty grid record
+
+        Args:
+            return_statuses (list): List of states to record a count of at each grid time
+            times (Iterable[float]): Times at which to record the state counts
+            count_transitions (bool): If True, also counts each type of transition in each interval between grid times
+        """
+        self.t = []
+        self.grid = sorted(float(t) for t in times)
+        self.states = {state: [] for state in return_statuses}
+        self.counts = {state: 0 for state in return_statuses}
+        self.count_transitions = count_transitions
+        self.transitions = dict()
+        self.interval_transitions = Counter()
+        self.next_index = 0
+
+    def __getstate__(self):
+        return _pack_state(self)
+
+    def __setstate__(self, state):
+        _unpack_state(self, state)
+
+    def set_initial_condition(self, t0, status):
+        """Sets the current state counts at the initial time
+
+        Args:
+            t0 (float) : Initial time
+            status (dict) : Initial states (node (str) -> state (str))
+
+        Grid times before the initial time are not recorded.
+        """
+        status_counter = Counter(status.values())
+        for state in self.counts:
+            self.counts[state] = status_counter[state]
+        while self.next_index < len(self.grid) and self.grid[self.next_index] < t0:
+            self.next_index += 1
+
+    def _snapshot(self):
+        self.t.append(self.grid[self.next_index])
+        for state, state_record in self.states.items():
+            state_record.append(self.counts[state])
+        if self.count_transitions:
+            for txncode in self.interval_transitions:
+                if txncode not in self.transitions:
+                    # pad intervals before the transition type was first seen
+                    self.transitions[txncode] = [0] * (len(self.t) - 1)
+            for txncode, record in self.transitions.items():
+                record.append(self.interval_transitions[txncode])
+            self.interval_transitions.clear()
+        self.next_index += 1
+
+    def add(self, t, enode="", anode="", group="", efrom="", eto="", astatus=""):
+        """Add an event, snapshotting the state counts at any grid times passed before it
+
+        Args:
+            t (float) : Current time
+            enode (str) : Node that is changing state in this event
+            anode (str) : Other nodes that affect the event
+            group (str) : Group that event occurs in/through (if applicable)
+            efrom (str) : State of node prior to change/event
+            eto (str) : State of node after change/event
+            astatus (str) : status of other nodes that affect the event
+        """
+        while self.next_index < len(self.grid) and self.grid[self.next_index] < t:
+            self._snapshot()
+        if efrom in self.counts:
+            self.counts[efrom] -= 1
+        if eto in self.counts:
+            self.counts[eto] += 1
+        if self.count_transitions:
+            self.interval_transitions[transition_code(efrom, astatus, eto)] += 1
+
+    def finalise(self, t):
+        """Snapshots the state counts at the remaining grid times up to the end time t"""
+        while self.next_index < len(self.grid) and self.grid[self.next_index] <= t:
+            self._snapshot()
+
+    def detach(self):
+        """Moves the grid times snapshotted so far into a new record, leaving this one empty
+
+        The current counts and the position in the grid carry on, so successive detached
+        records can be written (in order) to the same sim_id to build up the full record.
+        """
+        detached = GridRecords(
+            return_statuses=self.states,
+            times=(),
+            count_transitions=self.count_transitions,
+        )
+        detached.t = self.t
+        detached.grid = self.grid
+        detached.states = self.states
+        detached.counts = dict(self.counts)
+        detached.transitions = self.transitions
+        detached.next_index = self.next_index
+        self.t = []
+        self.states = {state: [] for state in self.states}
+        self.transitions = {txncode: [] for txncode in self.transitions}
+        return detached
+
+    def write(self, filename: PathLike, sim_id=None, mode="a", **attrs):
+        """Output the grid records to hdf5 format
+
+        Args:
+            filename (str): Path to file to output records into
+            sim_id (Hashable | None, optional): ID to use as the group name in the file. If None, generates a random id. If the group already exists, the records are appended to it. Defaults to None
+            mode (str): one of 'a' or 'w'. If 'a', appends; if 'w', overwrites the target file.
+            **attrs: Attributes to add to the group
+        """
+        import h5py
+
+        if sim_id is None:
+            sim_id = new_sim_id()
+
+        columns = {"t": self.t, **self.states, **self.transitions}
+
+        with h5py.File(filename, mode) as fp:
+            if sim_id in fp:
+                # continuation of a grid record (see detach)
+                grp = fp[sim_id]
+                grp.attrs.update(attrs)
+                n = grp["t"].shape[0]
+                # transitions not seen in every batch are zero where missing
+                for name in grp:
+                    if name not in columns:
+                        columns[name] = [0] * len(self.t)
+                for name, data in columns.items():
+                    if name not in grp:
+                        grp.create_dataset(
+                            name,
+                            data=[0] * n,
+                            dtype="i8",
+                            maxshape=(None,),
+                            chunks=True,
+                        )
+                    dataset = grp[name]
+                    dataset.resize((n + len(data),))
+                    dataset[n:] = data
+            else:
+                grp = fp.create_group(sim_id)
+                grp.attrs.update(attrs)
+                for name, data in columns.items():
+                    grp.create_dataset(
+                        name,
+                        data=data,
+                        dtype="f8" if name == "t" else "i8",
+                        maxshape=(None,),
+                        chunks=True,
+                    )
+
+        return sim_id
+
+    def write_columnar(
+        self, directory: PathLike, sim_id=None, format="parquet", **attrs
+    ):
+        """Output the grid records (as in to_dataframe) to a Parquet or Arrow IPC dataset (see write_columnar)"""
+        return write_columnar(
+            self.to_dataframe(), directory, sim_id=sim_id, format=format, **attrs
+        )
+
+    def to_dataframe(self):
+        import polars as pl
+
+        return pl.from_dict(
+            {
+                "t": self.t,
+                **self.states,
+                **self.transitions,
+            }
+        )
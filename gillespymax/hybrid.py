@@ -0,0 +1,151 @@
+"""Approximate (tau-leaping) hybrid stepping for GillespieMaxSim
+
+Instead of drawing reactions one at a time, a leap over an interval tau draws, for each
+weight bucket of the RateDict, the number of reactions of its items in the interval
+(Poisson), picks the reacting items uniformly from the bucket, and spreads the reactions
+uniformly over the interval. The events of each bucket's reactions are determined at once by the
+model's leap_choices, if it implements it (or else one at a time by transition_choice), and the
+events are then resolved in time order through manage_event, as in the exact engine.
+
+The approximation is that the rates are held fixed over the leap: items whose rate changes
+during the leap react as if it had not, and items that become active only react from the
+next leap. The leap is chosen so that the expected number of reactions of any item in a
+leap is at most epsilon, which controls the error. Leaps end at the next delayed event in the
+event queue (including events queued during the leap), which is then handled by an exact step.
+Exact steps are also taken when few reactions are expected in a leap (small populations),
+or when the rates are not kept by weight bucket (e.g. the SplitRates of aggregated infections).
+"""
+
+import numpy as np
+
+from .events import NoEvent
+from .ratedict import RateDict
+
+
+def hybrid_step(sim, until=100, epsilon=0.03, min_leap_events=20, rng=None):
+    """Advances the simulation by one leap, or by one exact step
+
+    Args:
+        sim (GillespieMaxSim): Simulation to advance
+        until (float, optional): Time to stop the simulation at. Defaults to 100.
+        epsilon (float, optional): Maximum expected number of reactions of any item in a leap. Defaults to 0.03.
+        min_leap_events (float, optional): Minimum expected number of reactions for a leap to be taken. Defaults to 20.
+        rng (np.random.Generator | None, optional): Generator for the leaps. Defaults to None.
+
+    Returns:
+        list | None: the actualised events, or None if the simulation has finished (as GillespieMaxSim.step)
+    """
+    rates = sim.rates
+    if sim.t >= until or not isinstance(rates, RateDict) or not rates.is_active():
+        # only rates kept by weight bucket (RateDict) are leapt over
+        return sim.step(until)
+
+    # empty buckets are kept by the RateDict, but cannot react
+    tau = epsilon / max(
+        rates.bucket_weight[bucket] for bucket, items in rates.weights.items() if items
+    )
+    tau = min(tau, until - sim.t)
+    if len(sim.event_queue) > 0:
+        # leap up to the next delayed event at most, which is then handled by an exact step
+        tau = min(tau, sim.event_queue[0][0] - sim.t)
+    if rates.total_weight * tau < min_leap_events:
+        return sim.step(until)
+
+    rng = np.random.default_rng(rng)
+
+    buckets = [(bucket, items) for bucket, items in rates.weights.items() if items]
+    weights = np.array([rates.bucket_weight[bucket] for bucket, _ in buckets])
+    sizes = np.array([len(items) for _, items in buckets])
+    n_reacting = rng.poisson(sizes * weights * tau)
+
+    t_start = sim.t
+    t_end = sim.t + tau
+
+    # (time, node, status at the start of the leap, event or None if still to be determined)
+    reactions = []
+    for (_, items), k in zip(buckets, n_reacting):
+        if k == 0:
+            continue
+        nodes = [items[i] for i in rng.integers(len(items), size=k)]
+        times = t_start + tau * rng.random(k)
+        choices = sim.leap_choices(nodes, times, rng)
+        if choices is None:
+            reactions.extend(
+                (t, node, None, None) for t, node in zip(times.tolist(), nodes)
+            )
+            continue
+        for idx, *event in choices:
+            node = nodes[idx]
+            reactions.append((float(times[idx]), node, sim.status[node], event))
+    reactions.sort(key=lambda reaction: reaction[0])
+
+    actualised_events = []
+    for t, node, status, event in reactions:
+        if len(sim.event_queue) > 0 and sim.event_queue[0][0] < t:
+            # a delayed event (queued during the leap) is due first: end the leap there,
+            # so that it is handled by the next step (the reactions are memoryless)
+            sim.t = sim.event_queue[0][0]
+            return actualised_events
+        sim.t = t
+        if event is None:
+            if node not in rates:
+                # stopped reacting earlier in the leap
+                continue
+            event_type, *aux_info = sim.transition_choice(node)
+            if event_type is NoEvent.no_event:
+                continue
+        elif sim.status[node] != status:
+            # determined from a state that the node has since left
+            continue
+        else:
+            event_type, *aux_info = event
+        events, influence_set = sim.manage_event(event_type, [node, *aux_info])
+        actualised_events.extend(events)
+        sim.update_influence_set(influence_set)
+
+    if len(sim.event_queue) > 0 and sim.event_queue[0][0] < t_end:
+        sim.t = sim.event_queue[0][0]
+    else:
+        sim.t = t_end
+    return actualised_events
+
+
+def iter_events_hybrid(
+    sim,
+    until=100,
+    epsilon=0.03,
+    min_leap_events=20,
+    seed=None,
+    record=True,
+):
+    """Runs the simulation with hybrid stepping, yielding each actualised event
+
+    See hybrid_step for the arguments. seed seeds the generator used for the leaps.
+    """
+    rng = np.random.default_rng(seed)
+    while (
+        events := hybrid_step(
+            sim,
+            until=until,
+            epsilon=epsilon,
+            min_leap_events=min_leap_events,
+            rng=rng,
+        )
+    ) is not None:
+        if record:
+            sim.record(events)
+        yield from events
+    if record:
+        sim.records.finalise(until)
+
+
+def run_hybrid(sim, until=100, epsilon=0.03, min_leap_events=20, seed=None):
+    """Runs the simulation with hybrid stepping (see hybrid_step)"""
+    for _ in iter_events_hybrid(
+        sim,
+        until=until,
+        epsilon=epsilon,
+        min_leap_events=min_leap_events,
+        seed=seed,
+    ):
+        pass
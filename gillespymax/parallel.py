@@ -0,0 +1,295 @@
+"""Experimental partitioned simulation of a single large network across processes
+
+The nodes of the graph are partitioned between worker processes. Each worker holds a
+full copy of the model, but only simulates the reactions of the nodes it owns; the
+other nodes are "ghosts" whose status is refreshed from their owners.
+
+Workers advance in lock-step over conservative time windows. An event of an owned node
+that changes the state of a node owned by another worker (e.g. an infection across the
+partition) is sent to that node's owner at the end of the window, and applied there at
+the window end time, if the target is still in the state the event expects.
+This is an approximation, whose error is bounded by the window width:
+cross-partition events are delayed by up to one window, and ghost statuses are up to one
+window stale. The delays and conflicts are reported in PartitionedSim.statistics.
+
+The model must implement change_state(node, to_state, **aux_info), returning the event,
+that is used to apply events from other workers. Models that keep state about other
+nodes beyond their status (e.g. aggregated group counts) are not supported, and
+aggregate_infection is rejected.
+"""
+
+import multiprocessing as mp
+import random
+import statistics
+from collections import Counter
+from typing import Hashable, Iterable, Mapping
+
+from .history import ContagionRecords
+
+
+def partition_groups(graph, n_parts: int, groups: Iterable[Hashable]):
+    """Partitions a group-structured graph by a layer of group nodes
+
+    The given groups are spread over the partitions, balancing the number of members.
+    Every other node is then put in the partition that most of its (already partitioned)
+    neighbours are in, so members follow their groups, and other groups follow their members.
+
+    Args:
+        graph (nx.Graph): Graph to partition
+        n_parts (int): Number of partitions
+        groups (Iterable): Group nodes that define the partition (e.g. the community layer)
+
+    Returns:
+        dict: node -> index of its partition
+    """
+    part = dict()
+    load = [0] * n_parts
+    for group in sorted(groups, key=lambda grp: len(graph[grp]), reverse=True):
+        idx = min(range(n_parts), key=load.__getitem__)
+        part[group] = idx
+        load[idx] += len(graph[group])
+
+    unassigned = [node for node in graph if node not in part]
+    while len(unassigned) > 0:
+        remaining = []
+        assigned = dict()
+        for node in unassigned:
+            votes = Counter(part[nb] for nb in graph.neighbors(node) if nb in part)
+            if len(votes) > 0:
+                assigned[node] = votes.most_common(1)[0][0]
+            else:
+                remaining.append(node)
+        if len(assigned) == 0:
+            # disconnected from all partitioned nodes
+            for node in remaining:
+                assigned[node] = min(range(n_parts), key=load.__getitem__)
+                load[assigned[node]] += 1
+            remaining = []
+        part.update(assigned)
+        unassigned = remaining
+
+    return part
+
+
+def _worker(conn, model_cls, model_kwargs, owned, seed):
+    random.seed(seed)
+    model = model_cls(**model_kwargs)
+    model.restrict_to(owned)
+
+    while True:
+        command, arg = conn.recv()
+        if command == "advance":
+            local, remote = [], []
+            for event in model.iter_events(until=arg, record=False):
+                (local if event["enode"] in model.owned else remote).append(event)
+            # an idle worker must still keep time with the others
+            model.t = arg
+            is_active = model.rates.is_active() or len(model.event_queue) > 0
+            conn.send((local, remote, is_active))
+        elif command == "deliver":
+            applied = []
+            for event in arg:
+                node = event["enode"]
+                if model.status[node] != event["efrom"]:
+                    # conflicting event (e.g. already infected)
+                    continue
+                aux_info = {
+                    k: event[k] for k in ("anode", "group", "astatus") if k in event
+                }
+                state_change = model.change_state(
+                    node, to_state=event["eto"], **aux_info
+                )
+                model.update_influence_set([node])
+                applied.append((state_change, event["t"]))
+            conn.send(applied)
+        elif command == "sync":
+            for node, state in arg.items():
+                if node not in model.owned:
+                    model.status[node] = state
+        elif command == "stop":
+            conn.close()
+            return
+
+
+class PartitionedSim:
+    """Runs a GillespieMaxSim model on a partitioned graph over multiple processes.
+
+    See the module documentation for the synchronisation scheme and its error.
+
+    Usage:
+        with PartitionedSim(SimpleContagionSim, graph, initial_state, n_parts=4, window=0.1, parameters=...) as sim:
+            sim.run(until=100)
+            sim.write("results.h5")
+    """
+
+    def __init__(
+        self,
+        model_cls,
+        graph,
+        initial_state: Mapping[Hashable, Hashable],
+        n_parts: int,
+        window: float,
+        initial_time=0.0,
+        parameters: Mapping | None = None,
+        return_statuses: Iterable | None = None,
+        partition: Mapping[Hashable, int] | None = None,
+        seed=None,
+        **model_kwargs,
+    ):
+        """Partitions the graph and starts the workers
+
+        Args:
+            model_cls (type): GillespieMaxSim subclass to simulate
+            graph (nx.Graph): Graph to simulate on
+            initial_state (Mapping): Initial state of each node
+            n_parts (int): Number of partitions (worker processes)
+            window (float): Width of the synchronisation time window (positive)
+            initial_time (float, optional): Defaults to 0.
+            parameters (Mapping | None, optional): Model parameters. Defaults to None.
+            return_statuses (Iterable | None, optional): States to record the counts of. Defaults to None.
+            partition (Mapping | None, optional): node -> partition index. If None, partitions by the group (bipartite == 1) nodes. Defaults to None.
+            seed (int | None, optional): Seed from which the worker seeds are drawn. Defaults to None.
+            **model_kwargs: Other arguments to model_cls
+        """
+        if window <= 0:
+            raise ValueError(f"window must be positive, got {window}")
+        if model_kwargs.get("aggregate_infection"):
+            # group counts of other workers' nodes would not be updated by sync or deliver
+            raise ValueError(
+                "Aggregated infections are not supported by the partitioned engine"
+            )
+        self.t = initial_time
+        self.window = window
+        self.status = {node: initial_state[node] for node in graph.nodes()}
+
+        if partition is None:
+            partition = partition_groups(
+                graph,
+                n_parts,
+                groups=[node for node in graph if graph.nodes[node]["bipartite"] == 1],
+            )
+        self.partition = partition
+
+        self.records = ContagionRecords(return_statuses=return_statuses)
+        self.records.set_initial_condition(self.t, self.status)
+
+        self.lags = []
+        self.n_remote = 0
+        self.n_conflicts = 0
+
+        model_kwargs = dict(
+            graph=graph,
+            initial_state=initial_state,
+            initial_time=initial_time,
+            parameters=parameters,
+            return_statuses=return_statuses,
+            **model_kwargs,
+        )
+        owned = [[] for _ in range(n_parts)]
+        for node, idx in partition.items():
+            owned[idx].append(node)
+
+        seeder = random.Random(seed)
+        self.connections = []
+        self.workers = []
+        for idx in range(n_parts):
+            parent_conn, child_conn = mp.Pipe()
+            worker = mp.Process(
+                target=_worker,
+                args=(
+                    child_conn,
+                    model_cls,
+                    model_kwargs,
+                    owned[idx],
+                    seeder.getrandbits(64),
+                ),
+                daemon=True,
+            )
+            worker.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _broadcast(self, command, arg=None):
+        for conn in self.connections:
+            conn.send((command, arg))
+
+    def run(self, until=100):
+
+        while self.t < until:
+            t_end = min(self.t + self.window, until)
+
+            self._broadcast("advance", t_end)
+            results = [conn.recv() for conn in self.connections]
+            local = sorted(
+                (event for events, _, _ in results for event in events),
+                key=lambda event: event["t"],
+            )
+            remote = sorted(
+                (event for _, events, _ in results for event in events),
+                key=lambda event: event["t"],
+            )
+            for event in local:
+                self.status[event["enode"]] = event["eto"]
+
+            # route cross-partition events to the owners of their target nodes
+            deliveries = [[] for _ in self.connections]
+            for event in remote:
+                deliveries[self.partition[event["enode"]]].append(event)
+            for conn, events in zip(self.connections, deliveries):
+                conn.send(("deliver", events))
+            applied = []
+            for conn in self.connections:
+                for state_change, t_event in conn.recv():
+                    applied.append(state_change)
+                    self.lags.append(t_end - t_event)
+                    self.status[state_change["enode"]] = state_change["eto"]
+            self.n_remote += len(remote)
+            self.n_conflicts += len(remote) - len(applied)
+
+            # refresh ghosts (including those changed by rejected events)
+            touched = {event["enode"] for event in local}
+            touched.update(event["enode"] for event in remote)
+            self._broadcast("sync", {node: self.status[node] for node in touched})
+
+            self.record(local)
+            self.record(applied)
+
+            self.t = t_end
+            if len(remote) == 0 and not any(is_active for _, _, is_active in results):
+                break
+
+        self.records.finalise(until)
+
+    def record(self, events):
+        for event in events:
+            self.records.add(**event)
+
+    @property
+    def statistics(self):
+        """Summary of the approximation error from the partitioning"""
+        return {
+            "n_remote": self.n_remote,
+            "n_conflicts": self.n_conflicts,
+            "mean_lag": statistics.fmean(self.lags) if len(self.lags) > 0 else 0.0,
+            "max_lag": max(self.lags, default=0.0),
+        }
+
+    def write(self, write_to, sim_id=None, **attrs):
+        return self.records.write(write_to, sim_id=sim_id, **attrs)
+
+    def close(self):
+        """Stops the worker processes"""
+        for conn, worker in zip(self.connections, self.workers):
+            if worker.is_alive():
+                conn.send(("stop", None))
+            worker.join()
+            conn.close()
+        self.connections = []
+        self.workers = []
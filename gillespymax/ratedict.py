@@ -4,6 +4,8 @@ Taken from [cobin](https://gitlab.com/cma-public-projects/cobin)
 """
 
 from collections import defaultdict
+from collections.abc import Mapping
+from itertools import count
 import random
 
 
@@ -13,31 +15,45 @@ class RateDict(object):
     Uses a cdf sampling on the weights, then a uniform draw over the nodes
     associated with those weights
     Efficient only if there are a small set of unique weights possible
+
+    Items with the same weight share a bucket. Buckets are identified by an id rather
+    than by their weight, so that the weight of a whole bucket can be changed at once (see remap).
     """
 
     def __init__(self):
+        # bucket -> items
         self.weights = defaultdict(list)
+        # item -> bucket
         self.itemmap = dict()
+        # bucket -> total weight of its items
         self.pdf = defaultdict(int)
+        # bucket -> weight of each of its items, and the reverse
+        self.bucket_weight = dict()
+        self.buckets = dict()
+        self.bucket_ids = count()
         self.total_weight = 0.0
 
     def __str__(self):
         return f"RateDict[items = {len(self)}, total_weight = {self.total_weight}]"
 
     def __len__(self):
-        return sum(int(v / k) for k, v in self.pdf.items())
+        return len(self.itemmap)
+
+    def __iter__(self):
+        return iter(self.itemmap)
 
     def __contains__(self, item):
-        return item in self.itemmap and self.itemmap[item] != 0
+        return item in self.itemmap
 
     def __getitem__(self, key):
-        return self.itemmap[key]
+        return self.bucket_weight[self.itemmap[key]]
 
     def is_active(self):
         r"""
         Returns whether or not there are any more non-negative weights left
         """
-        return self.total_weight > (min(self.pdf, default=0) / 2)
+        # zero weights are never inserted, so any remaining item has a non-zero weight
+        return len(self.itemmap) > 0
 
     def insert(self, item, weight=None, cast=None):
         r"""
@@ -55,28 +71,61 @@ class RateDict(object):
         if weight != 0:
             if cast is not None:
                 weight = cast(weight)
-            self.weights[weight].append(item)
-            self.itemmap[item] = weight
-            self.pdf[weight] += weight
+            bucket = self.buckets.get(weight)
+            if bucket is None:
+                bucket = next(self.bucket_ids)
+                self.buckets[weight] = bucket
+                self.bucket_weight[bucket] = weight
+            self.weights[bucket].append(item)
+            self.itemmap[item] = bucket
+            self.pdf[bucket] += weight
             self.total_weight += weight
 
     def remove(self, item):
         r"""
         Removes a given item, if it exists.
+
+        Empty buckets are kept (with their weight), so that the order of the buckets,
+        and so the sampling, depends only on the order in which weights were first seen.
         """
         if item in self:
-            w = self.itemmap[item]
-            self.weights[w].remove(item)
-            self.pdf[w] -= w
+            bucket = self.itemmap.pop(item)
+            w = self.bucket_weight[bucket]
+            self.weights[bucket].remove(item)
+            self.pdf[bucket] -= w
             self.total_weight -= w
-            del self.itemmap[item]
+
+    def remap(self, mapping):
+        r"""
+        Changes the weights of all items with a given weight at once,
+        at a cost of O(number of distinct weights) rather than O(number of items).
+
+        mapping is either a function or a Mapping from old weight to new weight.
+        Weights missing from a Mapping are unchanged.
+        If a new weight is 0, the items with the old weight are removed.
+        """
+        if isinstance(mapping, Mapping):
+            mapping = lambda w, mapping=mapping: mapping.get(w, w)
+        for bucket, old_weight in list(self.bucket_weight.items()):
+            new_weight = mapping(old_weight)
+            if new_weight == old_weight:
+                continue
+            if new_weight == 0:
+                for item in list(self.weights[bucket]):
+                    self.remove(item)
+                continue
+            self.bucket_weight[bucket] = new_weight
+            self.pdf[bucket] = new_weight * len(self.weights[bucket])
+        # buckets may now share a weight; new items join either of them
+        self.buckets = {w: bucket for bucket, w in self.bucket_weight.items()}
+        self.total_weight = sum(self.pdf.values())
 
     def choose_random(self):
         r"""
         Chooses a random node using reverse CDF mapping.
         """
-        w = random.choices(list(self.weights.keys()), weights=self.pdf.values(), k=1)
-        return random.choice(self.weights[w[0]])
+        bucket = random.choices(list(self.pdf.keys()), weights=self.pdf.values(), k=1)
+        return random.choice(self.weights[bucket[0]])
 
     def random_removal(self):
         r"""
@@ -0,0 +1,278 @@
+"""Rate stores for items whose weights are (almost) all different
+
+RateDict samples by weight bucket, which is efficient only if there are few distinct weights.
+RateTree keeps the weights of its items in a Fenwick (binary indexed) tree instead, so that
+updates and weighted random selection cost O(log n) however many distinct weights there are.
+SplitRates combines the two, for simulations where some items (e.g. aggregated group rates)
+have arbitrary weights, and the rest only take a few values.
+"""
+
+import random
+from collections.abc import Mapping
+from itertools import chain
+from typing import Iterable, Hashable
+
+from .ratedict import RateDict
+
+
+class FenwickTree(object):
+    """
+    Non-negative weights at positions 0..n-1, with O(log n) updates, prefix sums and search by
+    cumulative weight. Positions are added and removed at the end, as with a list.
+    """
+
+    __slots__ = ("values", "tree", "sum", "n_updates")
+
+    def __init__(self, values: Iterable[float] = ()):
+        self.values = list(values)
+        self._build()
+
+    def _build(self):
+        n = len(self.values)
+        tree = [0.0] * (n + 1)
+        for i, value in enumerate(self.values, start=1):
+            tree[i] += value
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self.tree = tree
+        # kept alongside the tree, so that the total is O(1)
+        self.sum = sum(self.values)
+        self.n_updates = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def prefix(self, n):
+        """Sum of the first n weights"""
+        total = 0.0
+        while n > 0:
+            total += self.tree[n]
+            n -= n & -n
+        return total
+
+    def total(self):
+        return self.sum
+
+    def set(self, index, value):
+        """Sets the weight at a position"""
+        delta = value - self.values[index]
+        self.values[index] = value
+        n = len(self.values)
+        i = index + 1
+        while i <= n:
+            self.tree[i] += delta
+            i += i & -i
+        self.sum += delta
+        self.n_updates += 1
+        if self.n_updates > 4 * n + 64:
+            # rebuild from the weights, so that rounding errors do not accumulate
+            self._build()
+
+    def append(self, value):
+        """Adds a weight at a new last position"""
+        i = len(self.values) + 1
+        self.values.append(value)
+        self.tree.append(value + self.prefix(i - 1) - self.prefix(i - (i & -i)))
+        self.sum += value
+
+    def pop(self):
+        """Removes the last position, returning its weight"""
+        self.tree.pop()
+        value = self.values.pop()
+        self.sum -= value
+        if len(self.values) == 0:
+            self._build()
+        return value
+
+    def find(self, target):
+        """Position of the first weight at which the cumulative weight exceeds target"""
+        n = len(self.values)
+        pos = 0
+        step = 1 << n.bit_length()
+        while step > 0:
+            nxt = pos + step
+            if nxt <= n and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        # guard against floating point error at the top end
+        pos = min(pos, n - 1)
+        while pos > 0 and self.values[pos] == 0:
+            pos -= 1
+        return pos
+
+
+class RateTree(object):
+    """
+    Items with arbitrary weights, kept in a Fenwick tree for O(log n) weighted random selection.
+    Items are kept densely (removal swaps in the last item), so that the tree has no empty positions.
+    Has the same interface as RateDict.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.position = dict()
+        self.tree = FenwickTree()
+
+    def __str__(self):
+        return f"RateTree[items = {len(self)}, total_weight = {self.total_weight}]"
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __contains__(self, item):
+        return item in self.position
+
+    def __getitem__(self, key):
+        return self.tree[self.position[key]]
+
+    @property
+    def total_weight(self):
+        return self.tree.total()
+
+    def is_active(self):
+        return len(self.items) > 0
+
+    def insert(self, item, weight=None, cast=None):
+        r"""
+        Inserts the item with the given weight, replacing its weight if already present.
+        If weight is 0, then it removes the item. cast is applied to the weight, if not None.
+        """
+        if weight == 0:
+            self.remove(item)
+            return
+        if cast is not None:
+            weight = cast(weight)
+        pos = self.position.get(item)
+        if pos is None:
+            self.position[item] = len(self.items)
+            self.items.append(item)
+            self.tree.append(weight)
+        else:
+            self.tree.set(pos, weight)
+
+    def remove(self, item):
+        r"""
+        Removes a given item, if it exists.
+        """
+        pos = self.position.pop(item, None)
+        if pos is None:
+            return
+        last = self.items.pop()
+        weight = self.tree.pop()
+        if last != item:
+            self.items[pos] = last
+            self.position[last] = pos
+            self.tree.set(pos, weight)
+
+    def remap(self, mapping):
+        r"""
+        Changes the weights of all items (see RateDict.remap), in O(number of items).
+        """
+        if isinstance(mapping, Mapping):
+            mapping = lambda w, mapping=mapping: mapping.get(w, w)
+        for item, weight in list(zip(self.items, self.tree.values)):
+            new_weight = mapping(weight)
+            if new_weight != weight:
+                self.insert(item, new_weight)
+
+    def choose_random(self, u=None):
+        r"""
+        Chooses a random item, with probability proportional to its weight.
+        """
+        if u is None:
+            u = random.random()
+        return self.items[self.tree.find(u * self.tree.total())]
+
+    def random_removal(self):
+        choice = self.choose_random()
+        self.remove(choice)
+        return choice
+
+    def next_time(self):
+        total_weight = self.total_weight
+        if total_weight > 0:
+            return random.expovariate(total_weight)
+        else:
+            return float("Inf")
+
+
+class SplitRates(object):
+    """
+    Rates kept in a RateDict, except for the given tree items, which are kept in a RateTree.
+    Both are sampled as one. Has the same interface as RateDict.
+    """
+
+    def __init__(self, tree_items: Iterable[Hashable]):
+        """
+        Args:
+            tree_items (Iterable): Items whose weights take many different values (e.g. group nodes)
+        """
+        self.tree_items = set(tree_items)
+        self.bucketed = RateDict()
+        self.tree = RateTree()
+
+    def __str__(self):
+        return f"SplitRates[items = {len(self)}, total_weight = {self.total_weight}]"
+
+    def __len__(self):
+        return len(self.bucketed) + len(self.tree)
+
+    def __iter__(self):
+        return chain(self.bucketed, self.tree)
+
+    def __contains__(self, item):
+        return item in self.bucketed or item in self.tree
+
+    def __getitem__(self, key):
+        if key in self.tree_items:
+            return self.tree[key]
+        return self.bucketed[key]
+
+    def _bucketed_weight(self):
+        # an empty RateDict can be left with a rounding error in its total weight
+        return self.bucketed.total_weight if len(self.bucketed.itemmap) > 0 else 0.0
+
+    @property
+    def total_weight(self):
+        return self._bucketed_weight() + self.tree.tree.sum
+
+    def is_active(self):
+        return self.bucketed.is_active() or self.tree.is_active()
+
+    def insert(self, item, weight=None, cast=None):
+        store = self.tree if item in self.tree_items else self.bucketed
+        store.insert(item, weight=weight, cast=cast)
+
+    def remove(self, item):
+        store = self.tree if item in self.tree_items else self.bucketed
+        store.remove(item)
+
+    def remap(self, mapping):
+        self.bucketed.remap(mapping)
+        self.tree.remap(mapping)
+
+    def choose_random(self):
+        bucketed_weight = self._bucketed_weight()
+        if random.random() * (bucketed_weight + self.tree.tree.sum) < bucketed_weight:
+            return self.bucketed.choose_random()
+        return self.tree.choose_random()
+
+    def random_removal(self):
+        choice = self.choose_random()
+        self.remove(choice)
+        return choice
+
+    def next_time(self):
+        total_weight = self.total_weight
+        if total_weight > 0:
+            return random.expovariate(total_weight)
+        else:
+            return float("Inf")
@@ -3,21 +3,43 @@
 Users should implement a subclass of GIllespieMaxSim
 """
 
+from __future__ import annotations
+
 import random
+from itertools import count
 from warnings import warn
 from abc import ABC, ABCMeta, abstractmethod
 
-import networkx as nx
-from sortedcontainers import SortedList
-
 from . import config_loader
-from .history import ContagionRecords
-from .events import BaseEvent, NoEvent
+from .history import ContagionRecords, GridRecords
+from .events import BaseEvent, NoEvent, ParameterEvent, EventQueue
 from .ratedict import RateDict
-
-from typing import Mapping, Iterable, Hashable, Any, SupportsFloat, Tuple
+from .writer import RecordWriter
+from .streams import CounterStreams
+
+from typing import (
+    TYPE_CHECKING,
+    Mapping,
+    Iterable,
+    Hashable,
+    Any,
+    SupportsFloat,
+    Tuple,
+    Callable,
+)
 from os import PathLike
 
+if TYPE_CHECKING:
+    import networkx as nx
+    from .graph import CompactGraph
+
+# fields of an event, as taken by the records (see ContagionRecords.add)
+EVENT_FIELDS = ("t", "enode", "anode", "group", "efrom", "eto", "astatus")
+
+
+def _empty_batch():
+    return {field: [] for field in EVENT_FIELDS}
+
 
 class Simulator(ABC):
 
@@ -27,12 +49,25 @@ class Simulator(ABC):
 
     def __init__(
         self,
-        graph: nx.Graph,
+        graph: nx.Graph | CompactGraph,
         initial_state: Mapping[Hashable, Hashable],
         initial_time: SupportsFloat = 0,
         parameters: Mapping | None = None,
         return_statuses: Iterable[Hashable] | None = None,
+        record_times: Iterable[SupportsFloat] | None = None,
+        record_transitions: bool = False,
+        random_streams: CounterStreams | None = None,
     ):
+        """
+        If record_times is given, only the counts of the return_statuses at those times
+        (and, if record_transitions is set, the number of each type of transition between them)
+        are recorded, instead of every event.
+
+        If random_streams is given, the draws made through uniform and choice come from
+        per (node, event class) streams, so that paired runs share common random numbers.
+        Event times and the choice of reacting node still come from the global generator, so they
+        are only shared if the arms have the same maximum rates (see streams).
+        """
         # Define the characteristics of the simulation
         self.graph = graph
         self.parameters = dict() if parameters is None else parameters
@@ -42,7 +77,14 @@ class Simulator(ABC):
 
         self.status = {node: initial_state[node] for node in self.graph.nodes()}
 
-        self.records = ContagionRecords(return_statuses=return_statuses)
+        if record_times is None:
+            self.records = ContagionRecords(return_statuses=return_statuses)
+        else:
+            self.records = GridRecords(
+                return_statuses=return_statuses,
+                times=record_times,
+                count_transitions=record_transitions,
+            )
         self.records.set_initial_condition(self.t, self.status)
 
         # transient data structures
@@ -50,6 +92,8 @@ class Simulator(ABC):
 
         self.rates = RateDict()
 
+        self.random_streams = random_streams
+
     @classmethod
     def checked_config_load(cls, config_file: PathLike):
         config = config_loader.load(config_file)
@@ -68,6 +112,21 @@ class Simulator(ABC):
     def default_return_states(self):
         return list(self._states.keys())
 
+    def uniform(self, node: Hashable, event_class: Hashable) -> float:
+        """Uniform variate for a draw of the given class about a node
+
+        Taken from the common random number streams if set, otherwise from the global generator.
+        """
+        if self.random_streams is None:
+            return random.random()
+        return self.random_streams.uniform(node, event_class)
+
+    def choice(self, seq, node: Hashable, event_class: Hashable):
+        """Uniform choice from a sequence for a draw of the given class about a node"""
+        if self.random_streams is None:
+            return random.choice(seq)
+        return self.random_streams.choice(seq, node, event_class)
+
     def record(self, events: Iterable[Mapping[str, Any]]):
         for event in events:
             self.records.add(**event)
@@ -76,19 +135,90 @@ class Simulator(ABC):
     def compute_initial_rates(self):
         pass
 
-    def write(self, write_to: str | PathLike):
-        self.records.write(write_to)
+    @abstractmethod
+    def step(self, until=100) -> list | None:
+        """Advances the simulation by a single reaction
+
+        Returns the list of actualised events (possibly empty),
+        or None if the simulation has finished before the given time.
+        Events are not recorded.
+        """
+        pass
+
+    def iter_events(self, until=100, record=True, batch_size=None):
+        """Runs the simulation, yielding each actualised event as it occurs
+
+        Args:
+            until (float, optional): Time to stop the simulation at. Defaults to 100.
+            record (bool, optional): If False, events are not added to the records. Defaults to True.
+            batch_size (int | None, optional): If given, yields columnar batches of (up to) this many events instead of single events. Defaults to None.
+
+        A columnar batch is a dict from each of EVENT_FIELDS to the list of its values over the events
+        in the batch (in order), with "" for fields that an event does not set.
+        """
+        batch = _empty_batch()
+        n_batch = 0
+        while (events := self.step(until)) is not None:
+            if record:
+                self.record(events)
+            if batch_size is None:
+                yield from events
+                continue
+            for event in events:
+                for field, column in batch.items():
+                    column.append(event.get(field, ""))
+                n_batch += 1
+                if n_batch == batch_size:
+                    yield batch
+                    batch = _empty_batch()
+                    n_batch = 0
+        if batch_size is not None and n_batch > 0:
+            yield batch
+        if record:
+            self.records.finalise(until)
+
+    def run(self, until=100):
+        while (events := self.step(until)) is not None:
+            self.record(events)
+        self.records.finalise(until)
+
+    def write(
+        self,
+        write_to: str | PathLike | RecordWriter,
+        sim_id=None,
+        format="hdf5",
+        **attrs,
+    ):
+        """Writes the records to file, or submits them to a background RecordWriter
+
+        format is one of 'hdf5', or 'parquet'/'ipc' to write into a partitioned dataset directory
+        (see history.write_columnar). It is ignored when submitting to a RecordWriter, which has its own.
+        Records submitted to a RecordWriter are moved out of the simulation (see records.detach),
+        so that the simulation can carry on without modifying them while they are written.
+
+        Returns the sim_id the records are written under.
+        """
+        if isinstance(write_to, RecordWriter):
+            return write_to.submit(self.records.detach(), sim_id=sim_id, **attrs)
+        if format != "hdf5":
+            return self.records.write_columnar(
+                write_to, sim_id=sim_id, format=format, **attrs
+            )
+        return self.records.write(write_to, sim_id=sim_id, **attrs)
 
 
 class GillespieMaxSim(Simulator):
 
     def __init__(
         self,
-        graph: nx.Graph,
+        graph: nx.Graph | CompactGraph,
         initial_state: Mapping[Hashable, str],
         initial_time=0,
         parameters: Mapping | None = None,
         return_statuses: Iterable | None = None,
+        record_times: Iterable | None = None,
+        record_transitions: bool = False,
+        random_streams: CounterStreams | None = None,
     ):
         super().__init__(
             graph=graph,
@@ -96,11 +226,20 @@ class GillespieMaxSim(Simulator):
             initial_time=initial_time,
             parameters=parameters,
             return_statuses=return_statuses,
+            record_times=record_times,
+            record_transitions=record_transitions,
+            random_streams=random_streams,
         )
 
         # transient data structure
         # for delayed events
-        self.event_queue = SortedList()
+        self.event_queue = EventQueue()
+
+        # nodes whose reactions are simulated, if not all of them (see restrict_to)
+        self.owned = None
+
+        # orders parameter changes scheduled for the same time
+        self.parameter_changes = count()
 
     @abstractmethod
     def maximum_rate(self, node: Hashable) -> SupportsFloat:
@@ -116,51 +255,121 @@ class GillespieMaxSim(Simulator):
     ) -> Tuple[Iterable, Iterable]:
         pass
 
+    def leap_choices(self, nodes: list, times, rng) -> list | None:
+        """Determines the events of a batch of reactions drawn in a leap (see hybrid)
+
+        The nodes all have the same maximum rate (they are drawn from one weight bucket).
+        Models can override this to classify the outcomes of the whole batch at once (e.g. with numpy),
+        from the states at the start of the leap.
+
+        Args:
+            nodes (list): Reacting nodes (possibly repeated)
+            times (np.ndarray): Time of each reaction
+            rng (np.random.Generator): Generator for the outcome draws
+
+        Returns:
+            list | None: (index into nodes, event_type, *aux_info) for each reaction that is not a null event,
+            or None to determine the events one at a time with transition_choice
+        """
+        return None
+
+    def schedule_parameters(self, t: SupportsFloat, **updates):
+        """Schedules a change of parameters at time t (e.g. an intervention)"""
+        self.event_queue.add(
+            (t, ParameterEvent.change, next(self.parameter_changes), updates)
+        )
+
+    def remap_rates(self, old_parameters: Mapping) -> Callable | Mapping | None:
+        """Called after the parameters have changed
+
+        Models can update any objects that depend on the parameters here.
+        Returns a mapping (or function) of old weight to new weight that is applied to
+        all the rates at once, or None if the rates of all nodes have to be recomputed.
+        """
+        return None
+
+    def change_parameters(self, updates: Mapping):
+        old_parameters = self.parameters
+        # copy, so that a shared parameter mapping is not modified
+        self.parameters = {**old_parameters, **updates}
+        mapping = self.remap_rates(old_parameters)
+        if mapping is None:
+            self.update_influence_set(self.graph)
+        else:
+            self.rates.remap(mapping)
+
     def update_influence_set(self, influence_set: Iterable[Hashable]):
         for nd in influence_set:
+            if self.owned is not None and nd not in self.owned:
+                continue
             weight = self.maximum_rate(nd)
             self.rates.insert(nd, weight=weight, cast=float)
 
     def compute_initial_rates(self):
         for node in self.graph:
+            if self.owned is not None and node not in self.owned:
+                continue
             self.rates.insert(node, weight=self.maximum_rate(node))
 
-    def run(self, until=100):
+    def restrict_to(self, nodes: Iterable[Hashable]):
+        """Only simulate the reactions of the given nodes
 
-        while self.rates.is_active() or len(self.event_queue):
+        Other nodes keep a status (that can be changed by events of the given nodes),
+        but never react themselves. Used to simulate one part of a partitioned graph.
+        """
+        self.owned = set(nodes)
+        for node in list(self.rates):
+            if node not in self.owned:
+                self.rates.remove(node)
 
-            # handle event queue
-            candidate_delay = self.rates.next_time()
-            # extract queued events until none happen before the candidate time to next event
-            while len(self.event_queue) > 0 and self.event_queue[0][0] < (
-                self.t + candidate_delay
-            ):
-                t_cand, event_type, *event_info = self.event_queue.pop(0)
-                if t_cand < self.t:
-                    warn(
-                        f"Event Queue produced event in the past ({t_cand}) < ({self.t}, ignoring..."
-                    )
-                    continue
-                self.t = t_cand
-                if self.t > until:
-                    break
-                events, influence_set = self.manage_event(event_type, event_info)
-                self.record(events)
-                self.update_influence_set(influence_set)
-                candidate_delay = self.rates.next_time()
+    def step(self, until=100):
 
-            self.t += candidate_delay
+        if self.t >= until or not (self.rates.is_active() or len(self.event_queue)):
+            return None
 
-            if self.t >= until:
+        actualised_events = []
+
+        # handle event queue
+        candidate_delay = self.rates.next_time()
+        # extract queued events until none happen before the candidate time to next event
+        while len(self.event_queue) > 0 and self.event_queue[0][0] < (
+            self.t + candidate_delay
+        ):
+            if self.event_queue[0][0] > until:
+                # leave it queued in case the simulation is continued
                 break
+            t_cand, event_type, *event_info = self.event_queue.pop(0)
+            if t_cand < self.t:
+                warn(
+                    f"Event Queue produced event in the past ({t_cand}) < ({self.t}, ignoring..."
+                )
+                continue
+            self.t = t_cand
+            if event_type is ParameterEvent.change:
+                self.change_parameters(event_info[-1])
+                candidate_delay = self.rates.next_time()
+                continue
+            events, influence_set = self.manage_event(event_type, event_info)
+            actualised_events.extend(events)
+            self.update_influence_set(influence_set)
+            candidate_delay = self.rates.next_time()
 
-            # Determine the type of event occuring
-            node = self.rates.choose_random()
-            event_type, *aux_info = self.transition_choice(node)
-            event_info = [node, *aux_info]
+        self.t += candidate_delay
 
-            # Manage reaction outcomes
-            if event_type is not NoEvent.no_event:
-                events, influence_set = self.manage_event(event_type, event_info)
-                self.record(events)
-                self.update_influence_set(influence_set)
+        if self.t >= until:
+            # the exponential clocks are memoryless, so a later run(until=...) continues exactly
+            self.t = until
+            return actualised_events
+
+        # Determine the type of event occuring
+        node = self.rates.choose_random()
+        event_type, *aux_info = self.transition_choice(node)
+        event_info = [node, *aux_info]
+
+        # Manage reaction outcomes
+        if event_type is not NoEvent.no_event:
+            events, influence_set = self.manage_event(event_type, event_info)
+            actualised_events.extend(events)
+            self.update_influence_set(influence_set)
+
+        return actualised_events
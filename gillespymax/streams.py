@@ -0,0 +1,52 @@
+"""Counter-based random streams for common random numbers
+
+Each (node, event class) pair has its own stream of uniform variates, indexed by the
+number of draws made from it so far. The k-th draw of a stream is a hash of
+(seed, node, event class, k), so it does not depend on any other draws made in the simulation.
+Paired runs (e.g. of two interventions) with the same seed then share their randomness
+wherever their trajectories coincide, which reduces the variance of their difference.
+
+The event times and the choice of reacting node are drawn from the global generator over
+the maximal rates, so they are only shared if the maximal rates are the same in both arms.
+As the engine thins, a model can bound its rates by the largest value of the parameters over
+the arms, and treat the rest of the bound as null events (e.g. SimpleContagionSim's rate_bounds).
+With the vignette model (400 individuals, 150 pairs, kappa 0.5 vs 0.7), the standard
+deviation of the difference in final size was 88 with independent seeds, 78 with a shared
+global seed, 70 with streams, and 27 with streams and kappa bounded at 0.7 (a tenth of the
+variance with independent seeds).
+"""
+
+import hashlib
+from collections import defaultdict
+
+
+class CounterStreams(object):
+    """
+    Uniform variates keyed by (node, event class, occurrence index).
+    Nodes and event classes are identified by their repr, so they should have a stable repr
+    (e.g. ints, strings, enum members).
+    """
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.key = int(seed).to_bytes(16, "little", signed=True)
+        self.counters = defaultdict(int)
+
+    def uniform(self, node, event_class):
+        r"""
+        Returns the next uniform variate in [0, 1) from the stream of the (node, event class) pair.
+        """
+        stream = (node, event_class)
+        index = self.counters[stream]
+        self.counters[stream] = index + 1
+        digest = hashlib.blake2b(
+            f"{node!r}|{event_class!r}|{index}".encode(), digest_size=8, key=self.key
+        ).digest()
+        # top 53 bits, as in random.random
+        return (int.from_bytes(digest, "little") >> 11) * (2.0**-53)
+
+    def choice(self, seq, node, event_class):
+        r"""
+        Chooses an element of a (non-empty) sequence with the next variate of the stream.
+        """
+        return seq[int(self.uniform(node, event_class) * len(seq))]
@@ -0,0 +1,203 @@
+"""Parameter sweeps over a model, with results cached by a hash of their configuration
+
+The sweep is declared in the config file, alongside the (base) parameters:
+
+    sweep:
+      design: grid            # or lhs (Latin hypercube)
+      samples: 20             # number of points (lhs only)
+      replicates: 10
+      seed: 0                 # base seed that replicate seeds are derived from
+      graph_seed: 0           # or a list of graph seeds
+      parameters:
+        beta: [0.5, 1.0, 1.5] # grid: values to take; lhs: [low, high]
+        kappa: [0.3, 0.7]
+
+Each (parameter point, graph seed, replicate) is a task, whose result is written to
+`<output_dir>/<hash>.h5`, where the hash is of the model class, setup function, parameters,
+graph seed and replicate seed (and the end time, and a user-supplied version). Tasks whose result
+file already exists are skipped, so extending a sweep only runs the new points. Changes to the
+code of the model or setup are not detected, so pass a new version to invalidate the cache.
+"""
+
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+from os import PathLike
+from typing import Any, Callable, Mapping
+
+
+def latin_hypercube(bounds: Mapping[str, Any], samples: int, seed=None):
+    """Latin hypercube design over the given bounds
+
+    Args:
+        bounds (Mapping): parameter name -> (low, high)
+        samples (int): Number of points
+        seed (int | None, optional): Seed for the design. Defaults to None.
+
+    Returns:
+        list[dict]: parameter name -> value, for each point
+    """
+    rng = random.Random(seed)
+    columns = dict()
+    for name, (low, high) in bounds.items():
+        strata = list(range(samples))
+        rng.shuffle(strata)
+        columns[name] = [
+            low + (high - low) * (stratum + rng.random()) / samples
+            for stratum in strata
+        ]
+    return [
+        {name: column[i] for name, column in columns.items()} for i in range(samples)
+    ]
+
+
+def expand(config: Mapping):
+    """Expands the sweep declared in a config into a list of parameter sets"""
+    base = config["parameters"]
+    sweep = config["sweep"]
+    design = sweep.get("design", "grid")
+    swept = sweep.get("parameters", dict())
+
+    if design == "grid":
+        names = list(swept)
+        points = [
+            dict(zip(names, values))
+            for values in itertools.product(*(swept[name] for name in names))
+        ]
+    elif design == "lhs":
+        points = latin_hypercube(swept, sweep["samples"], seed=sweep.get("seed"))
+    else:
+        raise ValueError(f"Unknown sweep design: {design}")
+
+    return [{**base, **point} for point in points]
+
+
+def config_hash(
+    model_cls: type,
+    parameters: Mapping,
+    graph_seed,
+    seed,
+    until,
+    setup: Callable | None = None,
+    version=None,
+) -> str:
+    """Stable hash of everything that determines the result of a simulation"""
+    payload = json.dumps(
+        {
+            "model": f"{model_cls.__module__}.{model_cls.__qualname__}",
+            "setup": (
+                None if setup is None else f"{setup.__module__}.{setup.__qualname__}"
+            ),
+            "version": version,
+            "parameters": parameters,
+            "graph_seed": graph_seed,
+            "seed": seed,
+            "until": until,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+def replicate_seed(base_seed, replicate: int) -> int:
+    """Seed of a replicate, derived stably from the base seed"""
+    digest = hashlib.sha256(f"{base_seed}:{replicate}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def _run_task(task):
+    random.seed(task["seed"])
+    sim = task["setup"](
+        task["model_cls"], task["parameters"], task["graph_seed"], task["seed"]
+    )
+    sim.run(until=task["until"])
+    # write to a temporary file first, so that only complete results are cached
+    tmp_path = f"{task['path']}.tmp{os.getpid()}"
+    sim.records.write(
+        tmp_path,
+        sim_id=task["key"],
+        mode="w",
+        parameters=json.dumps(task["parameters"], default=str),
+        graph_seed=str(task["graph_seed"]),
+        seed=task["seed"],
+        replicate=task["replicate"],
+    )
+    os.replace(tmp_path, task["path"])
+    return task["key"]
+
+
+def run_sweep(
+    model_cls: type,
+    setup: Callable,
+    config: Mapping | str | PathLike,
+    output_dir: str | PathLike,
+    until=100,
+    processes: int | None = None,
+    version=None,
+):
+    """Runs all tasks of a sweep that do not already have results on disk
+
+    Args:
+        model_cls (type): Simulator class being swept
+        setup (Callable): Function (model_cls, parameters, graph_seed, seed) -> Simulator that builds a ready-to-run simulation. The random module is seeded with the replicate seed before it is called. Must be picklable (e.g. a module-level function).
+        config (Mapping | PathLike): Config (or path to config file) with parameters and a sweep section
+        output_dir (PathLike): Directory that results are cached in
+        until (float, optional): Time to run each simulation until. Defaults to 100.
+        processes (int | None, optional): Number of worker processes. Defaults to the number of CPUs.
+        version (str | None, optional): Version of the model/setup code, included in the cache key. Defaults to None.
+
+    Returns:
+        list[dict]: the tasks of the sweep, with their parameters, seeds, result path and whether they were already cached
+    """
+    if not isinstance(config, Mapping):
+        config = model_cls.checked_config_load(config)
+    sweep = config["sweep"]
+
+    graph_seeds = sweep.get("graph_seed")
+    if not isinstance(graph_seeds, list):
+        graph_seeds = [graph_seeds]
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    tasks = []
+    for parameters in expand(config):
+        for graph_seed in graph_seeds:
+            for replicate in range(sweep.get("replicates", 1)):
+                seed = replicate_seed(sweep.get("seed", 0), replicate)
+                key = config_hash(
+                    model_cls,
+                    parameters,
+                    graph_seed,
+                    seed,
+                    until,
+                    setup=setup,
+                    version=version,
+                )
+                path = os.path.join(output_dir, f"{key}.h5")
+                tasks.append(
+                    {
+                        "key": key,
+                        "path": path,
+                        "parameters": parameters,
+                        "graph_seed": graph_seed,
+                        "replicate": replicate,
+                        "seed": seed,
+                        "cached": os.path.exists(path),
+                    }
+                )
+
+    pending = [
+        {**task, "model_cls": model_cls, "setup": setup, "until": until}
+        for task in tasks
+        if not task["cached"]
+    ]
+    if len(pending) > 0:
+        with mp.Pool(processes) as pool:
+            for _ in pool.imap_unordered(_run_task, pending):
+                pass
+
+    return tasks
@@ -0,0 +1,127 @@
+"""Background writing of records, so that output overlaps with simulation"""
+
+import multiprocessing as mp
+import traceback
+from os import PathLike
+
+from .history import new_sim_id
+
+
+def _drain(queue, errors, filename, mode, format):
+    """Writes the records put onto the queue, until None is put"""
+    failed = False
+    while True:
+        item = queue.get()
+        try:
+            if item is None:
+                return
+            # after a failure, the remaining items are dropped
+            if not failed:
+                records, sim_id, attrs = item
+                if format == "hdf5":
+                    records.write(filename, sim_id=sim_id, mode=mode, **attrs)
+                    mode = "a"
+                else:
+                    records.write_columnar(
+                        filename, sim_id=sim_id, format=format, **attrs
+                    )
+        except BaseException:
+            failed = True
+            errors.put(traceback.format_exc())
+        finally:
+            queue.task_done()
+
+
+class RecordWriter:
+    """Writes records to a file from a dedicated process.
+
+    Records are put onto a bounded queue that the writer process drains in order.
+    Converting and writing the records (e.g. in h5py) holds the GIL, so it is done in
+    another process rather than a thread, to overlap with the simulation.
+    The records are sent with their columns as NumPy arrays (see ContagionRecords.__getstate__),
+    so sending them costs much less than writing them.
+    Submitting blocks while the queue is full, so the simulation cannot run
+    arbitrarily far ahead of the disk.
+
+    Submitted records must not be modified afterwards, so Simulator.write submits
+    `records.detach()`. To write partial records of a running simulation, write
+    to the writer under a fixed sim_id; the batches are appended to the same group.
+
+    Usage:
+        with RecordWriter("results.h5") as writer:
+            for replicate in range(n):
+                sim = ...
+                sim.run()
+                sim.write(writer, replicate=replicate)
+    """
+
+    def __init__(self, filename: str | PathLike, mode="a", maxsize=4, format="hdf5"):
+        """Starts the writer process
+
+        Args:
+            filename (str): Path to file to output records into (or dataset directory, for columnar formats)
+            mode (str): one of 'a' or 'w'. If 'a', appends; if 'w', overwrites the target file (once, on the first write). Only applies to hdf5.
+            maxsize (int): Maximum number of record batches waiting to be written. Defaults to 4.
+            format (str): one of 'hdf5', 'parquet' or 'ipc' (see history.write_columnar). Defaults to 'hdf5'.
+        """
+        self.filename = filename
+        self.mode = mode
+        self.format = format
+        self.queue = mp.JoinableQueue(maxsize=maxsize)
+        # tracebacks of failed writes (the exceptions themselves may not pickle)
+        self.errors = mp.SimpleQueue()
+        self.error = None
+        self.closed = False
+        self.process = mp.Process(
+            target=_drain,
+            args=(self.queue, self.errors, filename, mode, format),
+            name="gillespymax-writer",
+            daemon=True,
+        )
+        self.process.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _raise_error(self):
+        if self.error is None and not self.errors.empty():
+            self.error = self.errors.get()
+        if self.error is not None:
+            raise RuntimeError(
+                f"Background write to {self.filename} failed:\n{self.error}"
+            )
+
+    def submit(self, records, sim_id=None, **attrs):
+        """Queues records to be written, blocking while the queue is full
+
+        Args:
+            records (ContagionRecords | GridRecords): Records to write
+            sim_id (Hashable | None, optional): ID to use as the group name in the file. If None, generates a random id. Defaults to None
+            **attrs: Attributes to add to the group
+
+        Returns:
+            sim_id of the group the records are written to
+        """
+        if self.closed:
+            raise ValueError("Cannot submit records to a closed RecordWriter")
+        self._raise_error()
+        if sim_id is None:
+            sim_id = new_sim_id()
+        self.queue.put((records, sim_id, attrs))
+        return sim_id
+
+    def flush(self):
+        """Blocks until all submitted records have been written"""
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Writes all submitted records, then stops the writer process"""
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.process.join()
+        self._raise_error()
@@ -0,0 +1,63 @@
+"""Compares simulation with and without aggregated (group-level) infections
+
+Reports the final size and peak prevalence (mean and standard error over replicates)
+and the mean wall time of each mode, for a few values of the transmission rate beta.
+Aggregation avoids the failed infection attempts of the node-level engine, so it gains
+the most when beta is high (and most attempts find no susceptible neighbour).
+"""
+
+import random
+import statistics
+import time
+
+import contagion
+from bench_hybrid import quick_network
+from gillespymax.ensemble import epidemic_summary
+
+N_INDVS = 5000
+N_SEEDS = 20
+N_REPLICATES = 10
+UNTIL = 60
+
+
+def main():
+
+    config = contagion.SimpleContagionSim.checked_config_load("config.yaml")
+
+    network = quick_network(N_INDVS)
+
+    def replicate(seed, beta, aggregate):
+        random.seed(seed)
+        initial_condition = contagion.SimpleContagionSim.create_initial_state(
+            graph=network, n_seeds=N_SEEDS
+        )
+        sim = contagion.SimpleContagionSim(
+            graph=network,
+            initial_state=initial_condition,
+            parameters={**config["parameters"], "beta": beta},
+            return_statuses="SEIRDTQ",
+            aggregate_infection=aggregate,
+        )
+        sim.run(until=UNTIL)
+        return epidemic_summary(sim)
+
+    for beta in (1.0, 4.0, 10.0):
+        for aggregate in (False, True):
+            summaries = []
+            start = time.perf_counter()
+            for seed in range(N_REPLICATES):
+                summaries.append(replicate(seed, beta, aggregate))
+            elapsed = (time.perf_counter() - start) / N_REPLICATES
+
+            name = f"{'aggregate' if aggregate else 'node'}[{beta}]"
+            report = [f"{name:>15}:"]
+            for stat in ("final_size", "peak_prevalence"):
+                values = [summary[stat] for summary in summaries]
+                se = statistics.stdev(values) / len(values) ** 0.5
+                report.append(f"{stat} {statistics.fmean(values):9.1f} +/- {se:6.1f}")
+            report.append(f"time {elapsed:6.2f}s")
+            print("  ".join(report))
+
+
+if __name__ == "__main__":
+    main()
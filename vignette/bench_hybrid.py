@@ -0,0 +1,82 @@
+"""Validates the hybrid (tau-leaping) engine against the exact engine
+
+Reports the final size and peak prevalence (mean and standard error over replicates)
+and the mean wall time of each engine, for a few values of the error control epsilon.
+"""
+
+import random
+import statistics
+import time
+
+import networkx as nx
+
+import contagion
+from gillespymax.ensemble import epidemic_summary
+from gillespymax.hybrid import run_hybrid
+
+N_INDVS = 20000
+N_SEEDS = 200
+N_REPLICATES = 10
+UNTIL = 20
+
+
+def quick_network(n_indvs, household_size=3, community_size=50, n_comm=2, seed=0):
+    """Two-layer bipartite network that is fast to build at large sizes"""
+    rng = random.Random(seed)
+    network = nx.Graph()
+    for indv in range(n_indvs):
+        network.add_node(indv, bipartite=0, demography=rng.randrange(4))
+    for indv in range(n_indvs):
+        household = f"HH{indv // household_size}"
+        network.add_node(household, bipartite=1, layer="HH")
+        network.add_edge(indv, household)
+    n_groups = n_indvs // community_size
+    for indv in range(n_indvs):
+        for group in rng.sample(range(n_groups), n_comm):
+            network.add_node(f"CC{group}", bipartite=1, layer="CC")
+            network.add_edge(indv, f"CC{group}")
+    return network
+
+
+def main():
+
+    config = contagion.SimpleContagionSim.checked_config_load("config.yaml")
+
+    network = quick_network(N_INDVS)
+
+    def replicate(seed, epsilon):
+        random.seed(seed)
+        initial_condition = contagion.SimpleContagionSim.create_initial_state(
+            graph=network, n_seeds=N_SEEDS
+        )
+        sim = contagion.SimpleContagionSim(
+            graph=network,
+            initial_state=initial_condition,
+            parameters=config["parameters"],
+            return_statuses="SEIRDTQ",
+        )
+        if epsilon is None:
+            sim.run(until=UNTIL)
+        else:
+            run_hybrid(sim, until=UNTIL, epsilon=epsilon, seed=seed)
+        return epidemic_summary(sim)
+
+    for epsilon in (None, 0.01, 0.03, 0.1):
+        summaries = []
+        start = time.perf_counter()
+        for seed in range(N_REPLICATES):
+            summaries.append(replicate(seed, epsilon))
+        elapsed = (time.perf_counter() - start) / N_REPLICATES
+
+        name = "exact" if epsilon is None else f"hybrid[{epsilon}]"
+        report = [f"{name:>12}:"]
+        for stat in ("final_size", "peak_prevalence"):
+            values = [summary[stat] for summary in summaries]
+            se = statistics.stdev(values) / len(values) ** 0.5
+            report.append(f"{stat} {statistics.fmean(values):9.1f} +/- {se:6.1f}")
+        report.append(f"time {elapsed:6.2f}s")
+        print("  ".join(report))
+
+
+if __name__ == "__main__":
+    main()
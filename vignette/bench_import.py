@@ -0,0 +1,86 @@
+"""Guards the import time of the core package against regressions
+
+Imports gillespymax in fresh interpreters, and fails (nonzero exit) if any of the
+heavy I/O and plotting dependencies are loaded at import, or if the median import time
+exceeds the budget. Run with -v to also print the slowest imports (from -X importtime).
+"""
+
+import statistics
+import subprocess
+import sys
+
+N_REPEATS = 7
+BUDGET = 0.15  # seconds
+
+HEAVY_MODULES = (
+    "networkx",
+    "sortedcontainers",
+    "h5py",
+    "polars",
+    "yaml",
+    "scipy",
+    "seaborn",
+    "matplotlib",
+)
+
+PROBE = f"""
+import sys, time
+start = time.perf_counter()
+import gillespymax
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+
+
+def import_once():
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True
+    )
+    elapsed, loaded = result.stdout.splitlines()
+    return float(elapsed), [m for m in loaded.split(",") if m]
+
+
+def slowest_imports(n=10):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import gillespymax"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, _, cumulative, name = (
+            part.strip() for part in line.replace(":", "|").split("|")
+        )
+        rows.append((int(cumulative), name))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main():
+    times, loaded = [], set()
+    for _ in range(N_REPEATS):
+        elapsed, heavy = import_once()
+        times.append(elapsed)
+        loaded.update(heavy)
+    median = statistics.median(times)
+    print(f"import gillespymax: median {median * 1e3:.1f}ms over {N_REPEATS} runs")
+
+    if "-v" in sys.argv:
+        for cumulative, name in slowest_imports():
+            print(f"{cumulative / 1e3:10.1f}ms  {name}")
+
+    failed = False
+    if len(loaded) > 0:
+        print(f"FAIL: heavy modules loaded at import: {', '.join(sorted(loaded))}")
+        failed = True
+    if median > BUDGET:
+        print(f"FAIL: import time exceeds budget of {BUDGET * 1e3:.0f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Compares the partitioned (multi-process) engine against the serial engine
+
+Reports the final size (mean and sd over replicates) and the mean wall time of each,
+along with the cross-partition event delays of the partitioned engine.
+"""
+
+import random
+import statistics
+import time
+
+import contagion
+import create_network
+from gillespymax.parallel import PartitionedSim, partition_groups
+
+N_INDVS = 2000
+N_REPLICATES = 40
+UNTIL = 50
+
+
+def final_size(records):
+    return records.states["S"][0] - records.states["S"][-1]
+
+
+def main():
+
+    config = contagion.SimpleContagionSim.checked_config_load("config.yaml")
+
+    network = create_network.create_twolayer_bipartite_network(
+        n_indvs=N_INDVS,
+        n_hh=N_INDVS // 3,
+        n_comm=2,
+        p_comm=0.4,
+        seed=0,
+    )
+    community = [node for node in network if str(node).startswith("CC")]
+
+    def serial(seed):
+        random.seed(seed)
+        initial_condition = contagion.SimpleContagionSim.create_initial_state(
+            graph=network, n_seeds=config["seeding"]["num"]
+        )
+        sim = contagion.SimpleContagionSim(
+            graph=network,
+            initial_state=initial_condition,
+            parameters=config["parameters"],
+            return_statuses="SEIRDTQ",
+        )
+        sim.run(until=UNTIL)
+        return final_size(sim.records), None
+
+    def partitioned(seed, n_parts, window):
+        random.seed(seed)
+        initial_condition = contagion.SimpleContagionSim.create_initial_state(
+            graph=network, n_seeds=config["seeding"]["num"]
+        )
+        with PartitionedSim(
+            contagion.SimpleContagionSim,
+            graph=network,
+            initial_state=initial_condition,
+            n_parts=n_parts,
+            window=window,
+            parameters=config["parameters"],
+            return_statuses="SEIRDTQ",
+            partition=partition_groups(network, n_parts, community),
+            seed=seed,
+        ) as sim:
+            sim.run(until=UNTIL)
+            return final_size(sim.records), sim.statistics
+
+    engines = {"serial": serial}
+    for n_parts in (2, 4):
+        for window in (0.05, 0.5):
+            engines[f"partitioned[{n_parts}, {window}]"] = (
+                lambda seed, n_parts=n_parts, window=window: partitioned(
+                    seed, n_parts, window
+                )
+            )
+
+    for name, engine in engines.items():
+        sizes, lags, conflicts = [], [], 0
+        start = time.perf_counter()
+        for seed in range(N_REPLICATES):
+            size, stats = engine(seed)
+            sizes.append(size)
+            if stats is not None:
+                lags.append(stats["mean_lag"])
+                conflicts += stats["n_conflicts"]
+        elapsed = (time.perf_counter() - start) / N_REPLICATES
+        print(
+            f"{name:>24}: final size {statistics.fmean(sizes):8.1f} +/- {statistics.stdev(sizes):6.1f}"
+            f"  time {elapsed:6.2f}s"
+            + (
+                f"  mean lag {statistics.fmean(lags):.3f}  conflicts {conflicts}"
+                if len(lags) > 0
+                else ""
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Measures how much of the output time the background RecordWriter hides
+
+Runs an ensemble of replicates without output, with each replicate written to hdf5 as
+it finishes, and with each replicate submitted to a RecordWriter, and reports the wall time
+of each. Ideally, the RecordWriter takes as long as the simulations alone. The writer process
+needs a core of its own for this, so there is no gain on a single core.
+"""
+
+import os
+import random
+import tempfile
+import time
+
+import contagion
+from bench_hybrid import quick_network
+from gillespymax import RecordWriter
+
+N_INDVS = 20000
+N_SEEDS = 200
+N_REPLICATES = 6
+UNTIL = 30
+
+
+def main():
+
+    config = contagion.SimpleContagionSim.checked_config_load("config.yaml")
+
+    network = quick_network(N_INDVS)
+
+    def replicate(seed):
+        random.seed(seed)
+        initial_condition = contagion.SimpleContagionSim.create_initial_state(
+            graph=network, n_seeds=N_SEEDS
+        )
+        sim = contagion.SimpleContagionSim(
+            graph=network,
+            initial_state=initial_condition,
+            parameters=config["parameters"],
+            return_statuses="SEIRDTQ",
+        )
+        sim.run(until=UNTIL)
+        return sim
+
+    print(f"{os.cpu_count()} cores")
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "results.h5")
+
+        start = time.perf_counter()
+        n_events = sum(len(replicate(seed).records.t) for seed in range(N_REPLICATES))
+        print(
+            f"{'no output':>15}: {time.perf_counter() - start:6.2f}s"
+            f"  ({n_events / N_REPLICATES:.0f} events per replicate)"
+        )
+
+        start = time.perf_counter()
+        writing = 0.0
+        for seed in range(N_REPLICATES):
+            sim = replicate(seed)
+            start_write = time.perf_counter()
+            sim.write(filename, replicate=seed)
+            writing += time.perf_counter() - start_write
+        print(
+            f"{'synchronous':>15}: {time.perf_counter() - start:6.2f}s"
+            f"  (of which writing {writing:.2f}s)"
+        )
+
+        os.remove(filename)
+        start = time.perf_counter()
+        with RecordWriter(filename) as writer:
+            for seed in range(N_REPLICATES):
+                replicate(seed).write(writer, replicate=seed)
+        print(f"{'RecordWriter':>15}: {time.perf_counter() - start:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
 import random
 import math
-from collections import OrderedDict, defaultdict
+from collections import Counter, OrderedDict, defaultdict
 from enum import Enum, auto
 from warnings import warn
 import networkx as nx
+import numpy as np
 from scipy.special import gammaincc as upper_incomplete_gamma
 
-from gillespymax import GillespieMaxSim, BaseEvent, NoEvent 
+from gillespymax import (
+    GillespieMaxSim,
+    GroupCounts,
+    CounterStreams,
+    BaseEvent,
+    NoEvent,
+)
+from gillespymax.ratetree import SplitRates
 from typing import Mapping, Iterable, Hashable, Any, SupportsFloat, Tuple
 from os import PathLike
 
@@ -50,6 +58,8 @@ class SimpleContagionSim(GillespieMaxSim):
         "outcome": "threshold for predetermined outcomes (death/recovery)",
         "gamma_hazard": "function that returns the actual gamma-distributed hazard at a given time",
         "entry_time": "time at which an individual entered their current state",
+        "group_counts": "susceptible/infected members of each group (only if aggregating infections)",
+        "context_groups": "number of groups of each context that a node is in (only if aggregating infections)",
     }
 
     class Event(BaseEvent, Enum):
@@ -57,6 +67,7 @@ class SimpleContagionSim(GillespieMaxSim):
         spontaneous = auto()
         infect = auto()
         seek_test = auto()
+        group_infect = auto()
 
     def __init__(
         self,
@@ -65,7 +76,25 @@ class SimpleContagionSim(GillespieMaxSim):
         initial_time=0,
         parameters: Mapping | None = None,
         return_statuses: Iterable | None = None,
+        record_times: Iterable | None = None,
+        record_transitions: bool = False,
+        random_streams: CounterStreams | None = None,
+        aggregate_infection: bool = False,
+        rate_bounds: Mapping[str, float] | None = None,
     ):
+        """
+        If aggregate_infection is set, infections are sampled through the group nodes
+        at the rate at which they succeed (using the number of susceptible members of each group),
+        instead of each infected node attempting infections at rate beta that fail
+        whenever the chosen neighbour is not susceptible. The dynamics are the same.
+
+        rate_bounds (parameter -> bound) fixes the part of the maximal rate of I due to
+        each of the given rate parameters (alpha_mort, kappa, alpha_recover, beta) at an upper bound
+        of the parameter. The rate beyond the parameter is thinned out as null events.
+        Paired runs (with common random_streams) that differ in bounded parameters then have the
+        same maximal rates, so draw the same event times and reacting nodes, and map the same
+        draws to the same outcomes.
+        """
 
         super().__init__(
             graph=graph,
@@ -73,25 +102,37 @@ class SimpleContagionSim(GillespieMaxSim):
             initial_time=initial_time,
             parameters=parameters,
             return_statuses=return_statuses,
+            record_times=record_times,
+            record_transitions=record_transitions,
+            random_streams=random_streams,
         )
 
-        scale = self.parameters["incubation_scale"]
-        shape = self.parameters["incubation_shape"]
-        const = 1.0 / (math.gamma(shape) * scale**shape)
-
-        def gamma_haz(t):
-            return (
-                const
-                * t ** (shape - 1)
-                * math.exp(-t / scale)
-                / upper_incomplete_gamma(shape, t / scale)
-            )
+        self.rate_bounds = dict() if rate_bounds is None else dict(rate_bounds)
+        for parameter in self.rate_bounds:
+            # raises if a bound is below its parameter
+            self.rate_width(parameter, self.parameters)
 
         self.sim_objects = dict()
         self.sim_objects["outcome"] = dict()
-        self.sim_objects["gamma_hazard"] = gamma_haz
+        self.sim_objects["gamma_hazard"] = self.incubation_hazard()
         self.sim_objects["entry_time"] = defaultdict(float)
 
+        self.aggregate_infection = aggregate_infection
+        if self.aggregate_infection:
+            groups = [
+                node for node in self.graph if self.graph.nodes[node]["bipartite"] == 1
+            ]
+            # group rates take arbitrary values, so are sampled from a tree rather than by weight
+            self.rates = SplitRates(tree_items=groups)
+            self.sim_objects["context_groups"] = dict()
+            self.sim_objects["group_counts"] = GroupCounts(
+                self.graph,
+                self.status,
+                groups,
+                tracked_states="SI",
+                weight=self.infection_weight,
+            )
+
         self.compute_initial_rates()
 
     @staticmethod
@@ -132,37 +173,165 @@ class SimpleContagionSim(GillespieMaxSim):
 
         return initial_state
 
+    def incubation_hazard(self):
+        """Returns the hazard function of the (gamma-distributed) incubation period"""
+        scale = self.parameters["incubation_scale"]
+        shape = self.parameters["incubation_shape"]
+        const = 1.0 / (math.gamma(shape) * scale**shape)
+
+        def gamma_haz(t):
+            return (
+                const
+                * t ** (shape - 1)
+                * math.exp(-t / scale)
+                / upper_incomplete_gamma(shape, t / scale)
+            )
+
+        return gamma_haz
+
+    def incubation_hazards(self, t):
+        """Vectorised hazard of the incubation period, at an array of times since exposure"""
+        scale = self.parameters["incubation_scale"]
+        shape = self.parameters["incubation_shape"]
+        const = 1.0 / (math.gamma(shape) * scale**shape)
+        return (
+            const
+            * t ** (shape - 1)
+            * np.exp(-t / scale)
+            / upper_incomplete_gamma(shape, t / scale)
+        )
+
+    def group_context(self, group):
+        """Returns the context (HH or CC) of a group node, from its layer or its name"""
+        return self.graph.nodes[group].get("layer", str(group)[:2])
+
+    def infection_weight(self, node, group):
+        """Relative rate at which an infected node attempts infections through the given group
+
+        The infected node chooses a context, then uniformly one of its groups in that context.
+        The context probability and beta are common to all members of the group and are applied
+        in group_infection_rate.
+        """
+        context_groups = self.sim_objects["context_groups"].get(node)
+        if context_groups is None:
+            # the groups of a node do not change, so their contexts are counted once
+            context_groups = Counter(
+                self.group_context(grp) for grp in self.graph.neighbors(node)
+            )
+            self.sim_objects["context_groups"][node] = context_groups
+        n_context_groups = context_groups[self.group_context(group)]
+        demography = self.graph.nodes[node].get("demography", 0)
+        return self.parameters["sigma_demographic"][demography] / n_context_groups
+
+    def group_infection_rate(self, group):
+        """Rate of successful infections in a group, given its susceptible and infected members"""
+        group_counts = self.sim_objects["group_counts"]
+        n_susceptible = group_counts.count(group, "S")
+        if n_susceptible == 0:
+            return 0
+        p_context = (
+            self.parameters["prop_time_at_home"]
+            if self.group_context(group) == "HH"
+            else 1 - self.parameters["prop_time_at_home"]
+        )
+        return (
+            self.parameters["beta"]
+            * p_context
+            * group_counts.total(group, "I")
+            * n_susceptible
+            / group_counts.size(group)
+        )
+
     def maximum_rate(self, node):
         """Determines the maximal rate of reaction for the given node."""
         state = self.status[node]
 
+        if state == "0" and self.aggregate_infection:
+            return self.group_infection_rate(node)
+
         if state in "SDRTQ0":
             return 0
 
         if node not in self.sim_objects["outcome"]:
             self.sim_objects["outcome"][node] = {
-                "death": random.random(),
-                "test_seeking": random.random(),
+                "death": self.uniform(node, "death"),
+                "test_seeking": self.uniform(node, "test_seeking"),
             }
 
+        match state:
+            case "E" | "I":
+                return self.state_rate(state, self.parameters)
+            case _:
+                raise RuntimeError(f"Unknown state: {state} of node {node}")
+
+    def rate_width(self, parameter, parameters):
+        """Part of the maximal rate of I due to a rate parameter: its bound if it has one (see rate_bounds)"""
+        rate = parameters[parameter]
+        bound = self.rate_bounds.get(parameter)
+        if bound is None:
+            return rate
+        if bound < rate:
+            raise ValueError(
+                f"Rate bound {bound} of {parameter} is below its value {rate}"
+            )
+        return bound
+
+    def state_rate(self, state, parameters):
+        """Maximal rate of reaction of an individual in state E or I, under the given parameters"""
         match state:
             case "E":
-                return 1.0 / self.parameters["incubation_scale"]
+                return 1.0 / parameters["incubation_scale"]
+            case "I" if self.aggregate_infection:
+                # infections are driven by the group nodes
+                return (
+                    self.rate_width("alpha_recover", parameters)
+                    + self.rate_width("alpha_mort", parameters)
+                    + self.rate_width("kappa", parameters)
+                )
             case "I":
                 return (
-                    self.parameters["beta"]
-                    + self.parameters["alpha_recover"]
-                    + self.parameters["alpha_mort"]
-                    + self.parameters["kappa"]
+                    self.rate_width("beta", parameters)
+                    + self.rate_width("alpha_recover", parameters)
+                    + self.rate_width("alpha_mort", parameters)
+                    + self.rate_width("kappa", parameters)
                 )
-            case _:
-                raise RuntimeError(f"Unknown state: {state} of node {node}")
+
+    def remap_rates(self, old_parameters):
+        """Updates the parameter-dependent objects after a change of parameters
+
+        Without aggregated infections, each individual's rate depends only on its state,
+        so the rates are remapped by state. Otherwise the group rates need recomputing.
+        """
+        if any(
+            old_parameters[parameter] != self.parameters[parameter]
+            for parameter in ("incubation_scale", "incubation_shape")
+        ):
+            self.sim_objects["gamma_hazard"] = self.incubation_hazard()
+
+        if self.aggregate_infection:
+            if (
+                old_parameters["sigma_demographic"]
+                != self.parameters["sigma_demographic"]
+            ):
+                self.sim_objects["group_counts"].reweight()
+            return None
+
+        old_rates = {state: self.state_rate(state, old_parameters) for state in "EI"}
+        new_rates = {state: self.state_rate(state, self.parameters) for state in "EI"}
+        if old_rates["E"] == old_rates["I"] and new_rates["E"] != new_rates["I"]:
+            # cannot tell the states apart by their rates
+            return None
+        return {old_rates[state]: new_rates[state] for state in "EI"}
 
     def transition_choice(self, node):
         """Determines the event that will occur, given a reaction is going to occur for a particular node"""
 
         state = self.status[node]
 
+        if state == "0":
+            # group node, only has a rate if infections are aggregated, which is exact
+            return (self.Event.group_infect,)
+
         if state == "I":
             # here, we could save compute by moving the bool computation to rate_function
             # since the quantites are static
@@ -176,7 +345,7 @@ class SimpleContagionSim(GillespieMaxSim):
                 < self.parameters["prob_death"]
             )
 
-        roll = random.random() * self.rates[node]
+        roll = self.uniform(node, "transition") * self.rates[node]
         if state == "E":
             # rejection sampling / thinning step for non-exponential hazard
             if roll < self.sim_objects["gamma_hazard"](
@@ -186,31 +355,95 @@ class SimpleContagionSim(GillespieMaxSim):
             else:
                 return (NoEvent.no_event,)
         if state == "I":
-            if roll < self.parameters["alpha_mort"]:
-                if is_die:
+            # each rate parameter has an interval of the roll, of the width of its bound (if any),
+            # and the roll is null where it is beyond the parameter (see rate_bounds)
+            parameters, bounds = self.parameters, self.rate_bounds
+            to_death = bounds.get("alpha_mort", parameters["alpha_mort"])
+            to_test = to_death + bounds.get("kappa", parameters["kappa"])
+            to_recover = to_test + bounds.get(
+                "alpha_recover", parameters["alpha_recover"]
+            )
+            if roll < to_death:
+                if is_die and roll < parameters["alpha_mort"]:
                     return self.Event.spontaneous, "D"
                 else:
                     return (NoEvent.no_event,)
-            elif roll < (self.parameters["alpha_mort"] + self.parameters["kappa"]):
-                if is_test:
+            elif roll < to_test:
+                if is_test and roll < to_death + parameters["kappa"]:
                     return (self.Event.seek_test,)
                 else:
                     return (NoEvent.no_event,)
-            elif roll < (
-                self.parameters["alpha_mort"]
-                + self.parameters["kappa"]
-                + self.parameters["alpha_recover"]
-            ):
-                if not is_die:
+            elif roll < to_recover:
+                if not is_die and roll < to_test + parameters["alpha_recover"]:
                     return self.Event.spontaneous, "R"
                 else:
                     return (NoEvent.no_event,)
+            elif self.aggregate_infection:
+                return (NoEvent.no_event,)
+            elif "beta" in bounds and roll >= to_recover + parameters["beta"]:
+                return (NoEvent.no_event,)
             else:
                 return (self.Event.infect,)
 
         warn(f"Unparsed state {state} of {node}", category=RuntimeWarning)
         return (NoEvent.no_event,)
 
+    def leap_choices(self, nodes, times, rng):
+        """Determines the events of a batch of reactions drawn in a leap, with the same thinning
+        as transition_choice, but over arrays of the reactions of each state at once.
+        """
+        states = defaultdict(list)
+        for idx, node in enumerate(nodes):
+            states[self.status[node]].append(idx)
+        if not states.keys() <= {"E", "I"}:
+            # group nodes are not leapt over
+            return None
+
+        rolls = self.rates[nodes[0]] * rng.random(len(nodes))
+        choices = []
+        if "E" in states:
+            idx = np.array(states["E"])
+            entry_time = self.sim_objects["entry_time"]
+            since_entry = times[idx] - np.array([entry_time[nodes[i]] for i in idx])
+            accepted = idx[rolls[idx] < self.incubation_hazards(since_entry)]
+            choices.extend((i, self.Event.spontaneous, "I") for i in accepted.tolist())
+        if "I" in states:
+            idx = np.array(states["I"])
+            outcome = self.sim_objects["outcome"]
+            is_test = np.array([outcome[nodes[i]]["test_seeking"] for i in idx]) < (
+                self.parameters["p_test_0"]
+            )
+            is_die = np.array([outcome[nodes[i]]["death"] for i in idx]) < (
+                self.parameters["prob_death"]
+            )
+            roll = rolls[idx]
+            parameters, bounds = self.parameters, self.rate_bounds
+            to_death = bounds.get("alpha_mort", parameters["alpha_mort"])
+            to_test = to_death + bounds.get("kappa", parameters["kappa"])
+            to_recover = to_test + bounds.get(
+                "alpha_recover", parameters["alpha_recover"]
+            )
+            die = (roll < parameters["alpha_mort"]) & is_die
+            test = (
+                (roll >= to_death) & (roll < to_death + parameters["kappa"]) & is_test
+            )
+            recover = (
+                (roll >= to_test)
+                & (roll < to_test + parameters["alpha_recover"])
+                & ~is_die
+            )
+            choices.extend((i, self.Event.spontaneous, "D") for i in idx[die].tolist())
+            choices.extend((i, self.Event.seek_test) for i in idx[test].tolist())
+            choices.extend(
+                (i, self.Event.spontaneous, "R") for i in idx[recover].tolist()
+            )
+            if not self.aggregate_infection:
+                infect = roll >= to_recover
+                if "beta" in bounds:
+                    infect &= roll < to_recover + parameters["beta"]
+                choices.extend((i, self.Event.infect) for i in idx[infect].tolist())
+        return choices
+
     def change_state(self, node, to_state, **aux_info):
         from_state = self.status[node]
         self.status[node] = to_state
@@ -242,20 +475,25 @@ class SimpleContagionSim(GillespieMaxSim):
             if node_status == "I":
                 context = (
                     "HH"
-                    if random.random() < self.parameters["prop_time_at_home"]
+                    if self.uniform(node, "context")
+                    < self.parameters["prop_time_at_home"]
                     else "CC"
                 )
                 all_groups = self.graph.neighbors(node)
                 valid_groups = [
-                    group for group in all_groups if group.startswith(context)
+                    group
+                    for group in all_groups
+                    if self.group_context(group) == context
                 ]
-                group = random.choice(valid_groups)
-                neighbour = random.choice(list(self.graph.neighbors(group)))
+                group = self.choice(valid_groups, node, "group")
+                neighbour = self.choice(
+                    list(self.graph.neighbors(group)), node, "neighbour"
+                )
                 if self.status[neighbour] == "S":
                     # draw for demographic susceptibility
                     neighbour_demography = self.graph.nodes[node].get("demography", 0)
                     if (
-                        random.random()
+                        self.uniform(node, "susceptibility")
                         < self.parameters["sigma_demographic"][neighbour_demography]
                     ):
                         state_change = self.change_state(
@@ -267,13 +505,33 @@ class SimpleContagionSim(GillespieMaxSim):
                         )
                         actualised_events.append(state_change)
                         influence_set.append(neighbour)
+        elif event_type is self.Event.group_infect:
+            (group,) = event_info
+            group_counts = self.sim_objects["group_counts"]
+            node = group_counts.choose(
+                group, "I", weighted=True, u=self.uniform(group, "infector")
+            )
+            neighbour = group_counts.choose(
+                group, "S", u=self.uniform(group, "neighbour")
+            )
+            state_change = self.change_state(
+                neighbour,
+                to_state="E",
+                anode=node,
+                astatus="I",
+                group=group,
+            )
+            actualised_events.append(state_change)
+            influence_set.append(neighbour)
         elif event_type is self.Event.seek_test:
             (node,) = event_info
             if self.status[node] == "I":
                 state_change = self.change_state(node, to_state="T")
+                low, high = self.parameters["test_return"]
                 self.event_queue.add(
                     (
-                        self.t + random.uniform(*self.parameters["test_return"]),
+                        self.t
+                        + (low + (high - low) * self.uniform(node, "test_return")),
                         self.Event.spontaneous,
                         node,
                         "Q",
@@ -282,4 +540,15 @@ class SimpleContagionSim(GillespieMaxSim):
                 actualised_events.append(state_change)
                 influence_set.append(node)
 
+        if self.aggregate_infection:
+            # group infection rates depend on the states of their members
+            for state_change in actualised_events:
+                influence_set.extend(
+                    self.sim_objects["group_counts"].update(
+                        state_change["enode"],
+                        state_change["efrom"],
+                        state_change["eto"],
+                    )
+                )
+
         return actualised_events, influence_set
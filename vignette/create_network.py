@@ -49,6 +49,11 @@ def create_twolayer_bipartite_network(
 
     combined = nx.compose(household, community)
 
+    # tag the context of each group node, so that it does not rely on the node name
+    for node, node_attrs in combined.nodes.items():
+        if node_attrs["bipartite"] == 1:
+            node_attrs["layer"] = node[:2]
+
     return combined
 
 
@@ -0,0 +1,54 @@
+import contagion
+import create_network
+from gillespymax.ensemble import run_adaptive
+
+
+def setup(parameters, seed):
+
+    network = create_network.create_twolayer_bipartite_network(
+        n_indvs=100,
+        n_hh=40,
+        n_comm=2,
+        p_comm=0.4,
+        seed=0,
+    )
+
+    initial_condition = contagion.SimpleContagionSim.create_initial_state(
+        graph=network,
+        n_seeds=5,
+    )
+
+    return contagion.SimpleContagionSim(
+        graph=network,
+        initial_state=initial_condition,
+        parameters=parameters,
+        return_statuses="SEIRDTQ",
+    )
+
+
+def main():
+
+    config = contagion.SimpleContagionSim.checked_config_load("config.yaml")
+
+    scenarios = {
+        f"kappa={kappa}": {**config["parameters"], "kappa": kappa}
+        for kappa in (0.5, 0.7)
+    }
+
+    results = run_adaptive(
+        setup,
+        scenarios,
+        target_width={"final_size": 10, "peak_prevalence": 4, "peak_time": 5},
+        max_replicates=500,
+    )
+
+    for name, result in results.items():
+        print(
+            f"{name}: {result['replicates']} replicates, converged: {result['converged']}"
+        )
+        for stat, running_stats in result["statistics"].items():
+            print(f"    {stat}: {running_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import contagion
+import create_network
+from gillespymax.sweep import run_sweep
+
+
+def setup(model_cls, parameters, graph_seed, seed):
+
+    network = create_network.create_twolayer_bipartite_network(
+        n_indvs=100,
+        n_hh=40,
+        n_comm=2,
+        p_comm=0.4,
+        seed=graph_seed,
+    )
+
+    initial_condition = model_cls.create_initial_state(
+        graph=network,
+        n_seeds=5,
+    )
+
+    return model_cls(
+        graph=network,
+        initial_state=initial_condition,
+        parameters=parameters,
+        return_statuses="SEIRDTQ",
+    )
+
+
+def main():
+
+    tasks = run_sweep(
+        contagion.SimpleContagionSim,
+        setup,
+        config="config.yaml",
+        output_dir="sweep_results",
+    )
+    n_cached = sum(task["cached"] for task in tasks)
+    print(f"{len(tasks)} tasks, {n_cached} already cached")
+
+
+if __name__ == "__main__":
+    main()